@@ -1,38 +1,265 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Set, Tuple
+import logging
 
-from app.db.database import get_db
-from app.models.schemas import CurrencyResponse, CurrencyCreate, CurrencyUpdate, TaskStatus
-from app.services.currency_service import CurrencyService
-from app.services.nats_service import get_nats_service
+from app.db.database import ReadSessionLocal, get_db, get_read_db
+from app.app_config import settings
+from app.models.schemas import (
+    BulkResponse,
+    ConversionBatchRequest,
+    ConversionBatchResponse,
+    ConversionResult,
+    CurrencyBulkCreate,
+    CurrencyBulkDelete,
+    CurrencyBulkUpdate,
+    CurrencyFieldsResponse,
+    CurrencyResponse,
+    CurrencyCreate,
+    CurrencyUpdate,
+    RateHistoryResponse,
+    RatePoint,
+    TaskStatus
+)
+from app.services.conversion_service import ConversionService
+from app.services.currency_service import CURRENCY_FIELDS, CurrencyService
+from app.services.events import Event
+from app.services.export_service import (
+    CURRENCY_EXPORT_FIELDS,
+    EXPORT_FORMATS,
+    HISTORY_EXPORT_FIELDS,
+    ExportService
+)
+from app.services.history_service import HistoryService
+from app.services.profiling import profiler
+from app.services.rate_providers import get_rate_fetcher
+from app.services.write_behind import WriteBehindError, get_write_queue
 from app.tasks.background_task import (
     get_task_status,
     trigger_manual_run
 )
-from app.ws.ws_manager import manager
-from datetime import datetime
+from app.tasks.outbox_publisher import get_outbox_status
+from app.ws.event_stream import StreamSubscription, matches_topics
+from app.ws.ws_manager import WILDCARD, manager, normalize_topic
+from app.ws.ws_fanout import ws_fanout
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["currencies"])
 
 
-@router.get("/currencies", response_model=List[CurrencyResponse])
-async def get_currencies(session: AsyncSession = Depends(get_db)):
-    currencies = await CurrencyService.get_all(session)
-    return currencies
+def _to_utc_naive(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _version_headers() -> dict:
+    """Валидаторы ответа по глобальной версии данных.
+
+    Для чтения из БД снимаются до запроса: версия может отстать от данных, но не опередить их.
+    """
+    snapshot = CurrencyService.snapshot
+    headers = {"Cache-Control": "no-cache"}
+    if snapshot.etag:
+        headers["ETag"] = snapshot.etag
+    if snapshot.modified_at:
+        headers["Last-Modified"] = format_datetime(snapshot.modified_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+async def _not_modified(request: Request, session: AsyncSession) -> Optional[Response]:
+    """304 по If-None-Match без сериализации.
+
+    Перед сравнением снимок сверяется с версией данных в БД (не чаще SNAPSHOT_CHECK_INTERVAL):
+    иначе процесс, не видевший чужой записи, отвечал бы 304 на устаревший тег.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match or not await CurrencyService.load_snapshot(session):
+        return None
+    
+    headers = _version_headers()
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "ETag" in headers and ("*" in tags or headers["ETag"] in tags):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+def _parse_fields(raw: Optional[str]) -> Optional[List[str]]:
+    if not raw:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in CURRENCY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return fields or None
+
+
+@router.get("/currencies", response_model=List[CurrencyFieldsResponse])
+async def get_currencies(
+    request: Request,
+    base: Optional[str] = Query(None, min_length=3, max_length=3),
+    target: Optional[str] = Query(None, min_length=3, max_length=3),
+    updated_since: Optional[datetime] = Query(None, description="Только пары, изменённые начиная с этого момента"),
+    include_inactive: bool = Query(False, description="Включая удалённые пары"),
+    cursor: Optional[int] = Query(None, ge=0, description="id последней пары предыдущей страницы"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.CURRENCIES_PAGE_MAX),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например id,base,target,current_rate"),
+    session: AsyncSession = Depends(get_read_db)
+):
+    projection = _parse_fields(fields)
+    
+    not_modified = await _not_modified(request, session)
+    if not_modified:
+        return not_modified
+    
+    headers = _version_headers()
+    
+    if not any((base, target, updated_since, include_inactive, cursor is not None, limit, projection)):
+        # Без параметров отдаём готовое тело из снимка; тело и версия снимаются без await между ними
+        body = await CurrencyService.get_all_json(session)
+        headers = _version_headers()
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    page = await CurrencyService.get_all(
+        session,
+        base=base,
+        target=target,
+        updated_since=_to_utc_naive(updated_since) if updated_since else None,
+        include_inactive=include_inactive,
+        after_id=cursor,
+        limit=limit,
+        fields=projection
+    )
+    
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load currencies"
+        )
+    
+    items, next_cursor = page
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return ORJSONResponse(items, headers=headers)
+
+
+def _check_bulk_size(count: int):
+    if count > settings.CURRENCIES_BULK_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items, max {settings.CURRENCIES_BULK_MAX}"
+        )
+
+
+def _bulk_item(index: int, currency_id: Optional[int], currency, result: str) -> dict:
+    return {
+        "index": index,
+        "id": currency_id,
+        "status": result if currency is not None else "not_found",
+        "currency": CurrencyResponse.model_validate(currency).model_dump() if currency is not None else None
+    }
+
+
+# Маршруты /bulk объявлены раньше /{currency_id}, иначе "bulk" разбирался бы как id
+@router.post("/currencies/bulk", response_model=BulkResponse, status_code=status.HTTP_201_CREATED)
+async def bulk_create_currencies(
+    request: CurrencyBulkCreate,
+    session: AsyncSession = Depends(get_db)
+):
+    _check_bulk_size(len(request.items))
+    created = await CurrencyService.bulk_create(session, request.items)
+    
+    if created is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to create currencies"
+        )
+    
+    return ORJSONResponse(
+        {"items": [_bulk_item(index, currency.id, currency, "created") for index, currency in enumerate(created)]},
+        status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.patch("/currencies/bulk", response_model=BulkResponse)
+async def bulk_update_currencies(
+    request: CurrencyBulkUpdate,
+    session: AsyncSession = Depends(get_db)
+):
+    _check_bulk_size(len(request.items))
+    
+    # Повторные изменения одной пары сливаются, побеждает последнее
+    updates = {}
+    for item in request.items:
+        change = CurrencyUpdate(**item.model_dump(exclude={"id"}, exclude_none=True))
+        previous = updates.get(item.id)
+        if previous is not None:
+            change = previous.model_copy(update=change.model_dump(exclude_none=True))
+        updates[item.id] = change
+    
+    currencies = await CurrencyService.update_many(session, updates, batch_event=True)
+    
+    if currencies is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update currencies"
+        )
+    
+    return ORJSONResponse({"items": [
+        _bulk_item(index, item.id, currencies.get(item.id), "updated")
+        for index, item in enumerate(request.items)
+    ]})
+
+
+@router.delete("/currencies/bulk", response_model=BulkResponse)
+async def bulk_delete_currencies(
+    request: CurrencyBulkDelete,
+    session: AsyncSession = Depends(get_db)
+):
+    _check_bulk_size(len(request.ids))
+    currencies = await CurrencyService.bulk_delete(session, request.ids)
+    
+    if currencies is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete currencies"
+        )
+    
+    # Уже удалённые и несуществующие пары - not_found
+    return ORJSONResponse({"items": [
+        _bulk_item(index, currency_id, currencies.get(currency_id), "deleted")
+        for index, currency_id in enumerate(request.ids)
+    ]})
 
 
 @router.get("/currencies/{currency_id}", response_model=CurrencyResponse)
-async def get_currency(currency_id: int, session: AsyncSession = Depends(get_db)):
-    currency = await CurrencyService.get_by_id(session, currency_id)
+async def get_currency(
+    currency_id: int,
+    request: Request,
+    session: AsyncSession = Depends(get_read_db)
+):
+    not_modified = await _not_modified(request, session)
+    # Тег общий на все пары: 304 только для существующей, иначе вместо 404 ушёл бы 304
+    if not_modified and CurrencyService.snapshot.get(currency_id) is not None:
+        return not_modified
+    
+    body = await CurrencyService.get_by_id_json(session, currency_id)
     
-    if not currency:
+    if body is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Currency not found"
         )
     
-    return currency
+    headers = _version_headers()
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.post("/currencies", response_model=CurrencyResponse, status_code=status.HTTP_201_CREATED)
@@ -48,30 +275,6 @@ async def create_currency(
             detail="Failed to create currency"
         )
     
-    try:
-        nats = get_nats_service()
-        await nats.publish_currency_created({
-            "id": db_currency.id,
-            "base": db_currency.base,
-            "target": db_currency.target,
-            "current_rate": db_currency.current_rate,
-            "last_updated": db_currency.last_updated.isoformat()
-        })
-    except Exception as e:
-        print(f"Ошибка публикации NATS: {e}")
-    
-    await manager.broadcast({
-        "event_type": "created",
-        "data": {
-            "id": db_currency.id,
-            "base": db_currency.base,
-            "target": db_currency.target,
-            "current_rate": db_currency.current_rate,
-            "last_updated": db_currency.last_updated.isoformat()
-        },
-        "timestamp": datetime.utcnow().isoformat()
-    })
-    
     return db_currency
 
 
@@ -81,7 +284,17 @@ async def update_currency(
     currency_update: CurrencyUpdate,
     session: AsyncSession = Depends(get_db)
 ):
-    db_currency = await CurrencyService.update(session, currency_id, currency_update)
+    if settings.WRITE_BEHIND:
+        # Ответ уходит после коммита пачки, в которую попало изменение
+        try:
+            db_currency = await get_write_queue().update(currency_id, currency_update)
+        except WriteBehindError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to update currency"
+            )
+    else:
+        db_currency = await CurrencyService.update(session, currency_id, currency_update)
     
     if not db_currency:
         raise HTTPException(
@@ -89,71 +302,207 @@ async def update_currency(
             detail="Currency not found"
         )
     
-    try:
-        nats = get_nats_service()
-        await nats.publish_currency_updated({
-            "id": db_currency.id,
-            "base": db_currency.base,
-            "target": db_currency.target,
-            "current_rate": db_currency.current_rate,
-            "last_updated": db_currency.last_updated.isoformat()
-        })
-    except Exception as e:
-        print(f"Ошибка публикации NATS: {e}")
-    
-    await manager.broadcast({
-        "event_type": "updated",
-        "data": {
-            "id": db_currency.id,
-            "base": db_currency.base,
-            "target": db_currency.target,
-            "current_rate": db_currency.current_rate,
-            "last_updated": db_currency.last_updated.isoformat()
-        },
-        "timestamp": datetime.utcnow().isoformat()
-    })
-    
     return db_currency
 
 
 @router.delete("/currencies/{currency_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_currency(currency_id: int, session: AsyncSession = Depends(get_db)):
-    result = await CurrencyService.delete(session, currency_id)
+    db_currency = await CurrencyService.delete(session, currency_id)
     
-    if not result:
+    if not db_currency:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Currency not found"
         )
     
-    try:
-        nats = get_nats_service()
-        await nats.publish_currency_deleted(currency_id)
-    except Exception as e:
-        print(f"Ошибка публикации NATS: {e}")
+    return None
+
+
+def _export_response(
+    name: str,
+    format: str,
+    fields: Sequence[str],
+    chunks: Callable[[AsyncSession], AsyncIterator[Sequence]]
+) -> StreamingResponse:
+    async def body():
+        yield ExportService.header(fields, format)
+        # Своя сессия: она живёт ровно столько, сколько идёт выгрузка
+        async with ReadSessionLocal() as session:
+            try:
+                async for rows in chunks(session):
+                    yield ExportService.encode(rows, fields, format)
+            except Exception as e:
+                # Статус уже отправлен: обрываем поток, чтобы клиент не принял обрезанный файл за целый
+                logger.error(f"Ошибка выгрузки {name}: {e}")
+                raise
+
+    filename = f"{name}-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/export/currencies")
+async def export_currencies(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_inactive: bool = Query(False, description="Включая удалённые пары")
+):
+    """Все пары потоком NDJSON или CSV, память не зависит от размера таблицы"""
+    return _export_response(
+        "currencies",
+        format,
+        CURRENCY_EXPORT_FIELDS,
+        lambda session: ExportService.currencies(session, include_inactive, settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+@router.get("/export/history")
+async def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    base: Optional[str] = Query(None, min_length=3, max_length=3),
+    target: Optional[str] = Query(None, min_length=3, max_length=3),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None)
+):
+    """Тики истории курсов потоком NDJSON или CSV"""
+    return _export_response(
+        "history",
+        format,
+        HISTORY_EXPORT_FIELDS,
+        lambda session: ExportService.history(
+            session,
+            base=base,
+            target=target,
+            since=_to_utc_naive(since) if since else None,
+            until=_to_utc_naive(until) if until else None,
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        )
+    )
+
+
+@router.get("/history/{base}/{target}", response_model=RateHistoryResponse)
+async def get_rate_history(
+    base: str,
+    target: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: int = Query(60, ge=1, description="Размер свечи в секундах"),
+    session: AsyncSession = Depends(get_read_db)
+):
+    end = _to_utc_naive(end) if end else datetime.utcnow()
+    start = _to_utc_naive(start) if start else end - timedelta(days=1)
     
-    await manager.broadcast({
-        "event_type": "deleted",
-        "data": {"id": currency_id},
-        "timestamp": datetime.utcnow().isoformat()
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    if (end - start).total_seconds() / resolution > settings.HISTORY_MAX_CANDLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many candles, max {settings.HISTORY_MAX_CANDLES}"
+        )
+    
+    candles = await HistoryService.get_candles(session, base, target, start, end, resolution)
+    
+    if candles is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load rate history"
+        )
+    
+    # Свечи уже валидны: минуем повторную проверку response_model и кодируем через orjson
+    return ORJSONResponse({
+        "base": base.upper(),
+        "target": target.upper(),
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "candles": [candle.model_dump() for candle in candles]
     })
+
+
+@router.get("/history/{base}/{target}/at", response_model=RatePoint)
+async def get_rate_at(
+    base: str,
+    target: str,
+    ts: datetime,
+    session: AsyncSession = Depends(get_read_db)
+):
+    point = await HistoryService.get_rate_at(session, base, target, _to_utc_naive(ts))
     
-    return None
+    if not point:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No rate recorded before this time"
+        )
+    
+    return point
+
+
+@router.get("/convert", response_model=ConversionResult)
+async def convert(
+    source: str = Query(..., alias="from", min_length=3, max_length=3),
+    target: str = Query(..., alias="to", min_length=3, max_length=3),
+    amount: float = Query(1.0, ge=0),
+    session: AsyncSession = Depends(get_read_db)
+):
+    conversion = await ConversionService.convert(session, source, target, amount)
+    
+    if not conversion:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No rate between these currencies"
+        )
+    
+    return conversion
+
+
+@router.post("/convert/batch", response_model=ConversionBatchResponse)
+async def convert_batch(
+    request: ConversionBatchRequest,
+    session: AsyncSession = Depends(get_read_db)
+):
+    if len(request.items) > settings.CONVERT_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items, max {settings.CONVERT_BATCH_MAX}"
+        )
+    
+    items = await ConversionService.convert_batch(session, request.items)
+    
+    if items is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load rates"
+        )
+    
+    return ORJSONResponse({"items": items})
 
 
 @router.post("/tasks/run")
 async def run_background_task():
     try:
-        await trigger_manual_run()
-        return {
-            "status": "triggered",
-            "message": "Background task triggered successfully"
-        }
+        leader_id = await trigger_manual_run()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to trigger task: {str(e)}"
         )
+    
+    if leader_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No active leader to run the task"
+        )
+    
+    return {
+        "status": "triggered",
+        "message": "Background task triggered successfully",
+        "leader": leader_id
+    }
 
 
 @router.get("/tasks/status", response_model=TaskStatus)
@@ -161,9 +510,182 @@ async def get_task_status_endpoint():
     return get_task_status()
 
 
+@router.get("/tasks/providers")
+async def get_provider_stats():
+    try:
+        return get_rate_fetcher().get_stats()
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+
+
+@router.get("/tasks/outbox")
+async def get_outbox_status_endpoint():
+    return get_outbox_status()
+
+
+def _parse_pairs(pairs: Optional[str]) -> Set[str]:
+    if not pairs:
+        return {WILDCARD}
+    topics = set()
+    for item in pairs.split(","):
+        topic = normalize_topic(item)
+        if topic is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid pair: {item}"
+            )
+        topics.add(topic)
+    return topics
+
+
+def _parse_event_id(value: str) -> Tuple[Optional[str], int]:
+    """stream:seq; всё остальное (например 0) не догоняется и даёт снимок"""
+    stream_id, _, seq = value.rpartition(":")
+    try:
+        return stream_id or None, int(seq)
+    except ValueError:
+        return None, -1
+
+
+async def _ensure_snapshot():
+    if not CurrencyService.snapshot.loaded:
+        async with ReadSessionLocal() as session:
+            await CurrencyService.load_snapshot(session)
+
+
+def _missed_events(topics: Set[str], resume: Tuple[Optional[str], int]) -> List[Event]:
+    """Пропущенное из буфера потока или снимок; вызывать без await после подписки"""
+    missed = manager.stream.since(*resume)
+    if missed is None:
+        return [manager.snapshot_frame(topics)]
+    return [event for event in missed if matches_topics(topics, event.pairs)]
+
+
+def _sse_frame(event: Event) -> bytes:
+    return b"id: %s\ndata: %s\n\n" % (manager.stream.event_id(event.seq).encode(), event.payload)
+
+
+async def _sse_stream(subscription: StreamSubscription, backlog: List[Event]):
+    try:
+        yield b"retry: %d\n\n" % settings.STREAM_RETRY_MS
+        if backlog:
+            yield b"".join(_sse_frame(event) for event in backlog)
+        while True:
+            if not await subscription.wait(settings.STREAM_HEARTBEAT):
+                yield b": keepalive\n\n"
+                continue
+            if subscription.overflow:
+                # Клиент не успевает: закрываем, EventSource вернётся с Last-Event-ID
+                return
+            yield b"".join(_sse_frame(event) for event in subscription.drain())
+    finally:
+        manager.stream.unsubscribe(subscription)
+
+
+@router.get("/stream/currencies")
+async def stream_currencies(
+    request: Request,
+    pairs: Optional[str] = Query(None, description="Пары через запятую: USD/EUR, USD/*, */EUR; по умолчанию все"),
+    last_event_id: Optional[str] = Query(None, description="Id последнего события, если клиент не шлёт Last-Event-ID")
+):
+    """Server-Sent Events с теми же событиями, что и /ws/currencies"""
+    topics = _parse_pairs(pairs)
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    if resume_from is not None:
+        await _ensure_snapshot()
+
+    # Подписка и догонка без await между ними: ни одно событие не потеряется и не задвоится
+    subscription = manager.stream.subscribe(topics, settings.STREAM_PENDING_MAX)
+    backlog = _missed_events(topics, _parse_event_id(resume_from)) if resume_from is not None else []
+
+    return StreamingResponse(
+        _sse_stream(subscription, backlog),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/stream/currencies/poll")
+async def poll_currencies(
+    pairs: Optional[str] = Query(None, description="Пары через запятую: USD/EUR, USD/*, */EUR; по умолчанию все"),
+    cursor: Optional[str] = Query(None, description="cursor из прошлого ответа; без него - ждать следующего изменения"),
+    timeout: float = Query(25.0, ge=0, le=settings.STREAM_POLL_MAX_TIMEOUT)
+):
+    """Long-poll: отвечает сразу, если после cursor были события, иначе ждёт изменения до timeout"""
+    topics = _parse_pairs(pairs)
+    if cursor is not None:
+        await _ensure_snapshot()
+
+    subscription = manager.stream.subscribe(topics, settings.STREAM_PENDING_MAX)
+    try:
+        events = _missed_events(topics, _parse_event_id(cursor)) if cursor is not None else []
+        if not events and await subscription.wait(timeout):
+            events = subscription.drain()
+            if subscription.overflow:
+                events = [manager.snapshot_frame(topics)]
+        # Курсор - текущий seq: всё, что было до него и подходит под pairs, уже в ответе
+        next_cursor = manager.stream.event_id()
+    finally:
+        manager.stream.unsubscribe(subscription)
+
+    body = b'{"cursor":"%s","events":[%s]}' % (
+        next_cursor.encode(),
+        b",".join(event.payload for event in events)
+    )
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+def _check_profiling(request: Request):
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is disabled"
+        )
+    # Профили раскрывают стеки и пути к файлам: без PROFILING_SECRET админка закрыта
+    if not profiler.authorized(request.headers.get("x-profile")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid profiling token" if settings.PROFILING_SECRET else "PROFILING_SECRET is not set"
+        )
+
+
+@router.get("/admin/profiles", dependencies=[Depends(_check_profiling)])
+async def list_profiles():
+    """Самые медленные профили, по убыванию длительности"""
+    return {
+        **profiler.get_status(),
+        "profiles": [profile.summary() for profile in profiler.profiles()]
+    }
+
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(_check_profiling)])
+async def get_profile(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|collapsed)$", description="text или collapsed (flamegraph)")
+):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    return PlainTextResponse(profile.collapsed() if format == "collapsed" else profile.text())
+
+
+@router.delete("/admin/profiles", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(_check_profiling)])
+async def clear_profiles():
+    profiler.clear()
+
+
 @router.get("/health")
 async def health_check():
     return {
         "status": "ok",
-        "websocket_connections": manager.get_connection_count()
+        "websocket_connections": manager.get_connection_count(),
+        "websocket_fanout": ws_fanout.get_status(),
+        "websocket_stream": manager.stream.get_status(),
+        "write_behind": get_write_queue().get_status()
     }
@@ -1,18 +1,114 @@
 import os
+from typing import List
 from pydantic_settings import BaseSettings
 
+
+def _split_codes(value: str) -> List[str]:
+    return [code.strip().upper() for code in value.split(",") if code.strip()]
+
+
 class Settings(BaseSettings):
     APP_NAME: str = "Currency Exchange API"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = True
     
     DATABASE_URL: str = "sqlite+aiosqlite:///./currency.db"
+    # default - один пул как есть; sqlite_wal - WAL, PRAGMA и раздельные движки чтения/записи
+    DB_PROFILE: str = "default"
+    DB_READ_POOL_SIZE: int = 8
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_MMAP_SIZE: int = 268435456
 
     NATS_URL: str = os.getenv("NATS_URL", "nats://localhost:4222")
 
     BACKGROUND_TASK_INTERVAL: int = 60
 
+    # Лидер выполняет фоновые задачи; при его падении другой процесс перехватит аренду через TTL
+    LEADER_LEASE_TTL: float = 15.0
+    LEADER_HEARTBEAT: float = 5.0
+
+    # Валютная вселенная: базы x цели, через запятую
+    RATE_BASES: str = "USD"
+    RATE_TARGETS: str = "EUR,GBP,JPY,CNY,INR,CAD,AUD,CZK,EGP,RUB"
+
+    # Провайдеры курсов в порядке приоритета: frankfurter, erapi, stub
+    RATE_PROVIDERS: str = "frankfurter,erapi"
+    RATE_HEDGE_DELAY: float = 1.0
+    EXCHANGE_API_URL: str = "https://api.frankfurter.app/latest"
+    ERAPI_URL: str = "https://open.er-api.com/v6/latest"
+
+    STUB_LATENCY: float = 0.0
+    STUB_ERROR_RATE: float = 0.0
+    STUB_TICK: float = 1.0
+
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_READ_TIMEOUT: float = 30.0
+    UPSTREAM_MAX_CONNECTIONS: int = 10
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 120.0
+    UPSTREAM_CONCURRENCY: int = 5
+    UPSTREAM_RATE_LIMIT: float = 10.0
+
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_MAX_BACKOFF: float = 30.0
+    OUTBOX_RETENTION: int = 3600
+
     WS_SEND_TIMEOUT: int = 60
+    WS_QUEUE_SIZE: int = 100
+    # Внутренний subject для рассылки событий между воркерами
+    WS_FANOUT_SUBJECT: str = "internal.ws.events"
+    WS_FANOUT_DEDUPE_SIZE: int = 10000
+    # Последние события для догонки после переподключения (?stream=&last_seq=)
+    WS_REPLAY_BUFFER: int = 10000
+
+    # SSE и long-poll на /api/stream/currencies
+    STREAM_HEARTBEAT: float = 15.0
+    STREAM_RETRY_MS: int = 3000
+    STREAM_PENDING_MAX: int = 1000
+    STREAM_POLL_MAX_TIMEOUT: float = 60.0
+
+    # Строк на пачку серверного курсора в /api/export
+    EXPORT_CHUNK_SIZE: int = 1000
+
+    # Как часто (с) сверять снимок курсов с версией данных в БД: предел устаревания при нескольких процессах
+    SNAPSHOT_CHECK_INTERVAL: float = 1.0
+
+    HISTORY_MAX_CANDLES: int = 5000
+
+    CONVERT_BATCH_MAX: int = 10000
+
+    CURRENCIES_PAGE_MAX: int = 1000
+    CURRENCIES_BULK_MAX: int = 5000
+
+    # Отложенная запись PATCH: изменения пары за окно сливаются и коммитятся пачкой
+    WRITE_BEHIND: bool = False
+    WRITE_BEHIND_WINDOW: float = 0.05
+    WRITE_BEHIND_MAX_BATCH: int = 1000
+
+    # Prometheus-метрики процесса на GET /metrics
+    METRICS_ENABLED: bool = True
+
+    # Профилирование: доля запросов или заголовок X-Profile: <PROFILING_SECRET>
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_SECRET: str = ""
+    PROFILING_INTERVAL: float = 0.005
+    PROFILING_KEEP: int = 20
+    PROFILING_BACKGROUND: bool = True
+    
+    @property
+    def rate_bases(self) -> List[str]:
+        return _split_codes(self.RATE_BASES)
+
+    @property
+    def rate_targets(self) -> List[str]:
+        return _split_codes(self.RATE_TARGETS)
+
+    @property
+    def rate_providers(self) -> List[str]:
+        return [name.lower() for name in _split_codes(self.RATE_PROVIDERS)]
     
     class Config:
         env_file = ".env"
@@ -1,21 +1,106 @@
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import logging
+import time
+import uuid
 
 from app.app_config import settings
+from app.services.metrics import DB_QUERY_DURATION, DB_QUERY_ERRORS
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    pool_pre_ping=True,
-)
+
+def _sqlite_pragmas(writer: bool):
+    """PRAGMA на каждое новое соединение профиля sqlite_wal"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if writer:
+        # Режим журнала хранится в самом файле, но переключить его может только пишущее соединение
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+    else:
+        pragmas.append("PRAGMA query_only = ON")
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+
+if settings.DB_PROFILE == "sqlite_wal":
+    # Один пишущий коннект: писатели ждут в очереди пула, а не на блокировке файла.
+    # Читатели в WAL не блокируются писателем и идут через отдельный пул.
+    # По умолчанию aiosqlite открывает соединение на каждую сессию (NullPool),
+    # здесь соединения и их PRAGMA/кэш страниц живут в пуле.
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    read_engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_pragmas(writer=True))
+    event.listen(read_engine.sync_engine, "connect", _sqlite_pragmas(writer=False))
+else:
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=False,
+        pool_pre_ping=True,
+    )
+    read_engine = engine
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+
+
+def _instrument(sync_engine, name: str):
+    """Время каждого SQL-запроса в гистограмму db_query_duration_seconds"""
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.labels(name, _operation(statement)).observe(
+            time.perf_counter() - context._query_started
+        )
+
+    def on_error(exception_context):
+        DB_QUERY_ERRORS.labels(name, _operation(exception_context.statement)).inc()
+
+    event.listen(sync_engine, "before_cursor_execute", before_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_execute)
+    event.listen(sync_engine, "handle_error", on_error)
+
+
+_instrument(engine.sync_engine, "write" if read_engine is not engine else "default")
+if read_engine is not engine:
+    _instrument(read_engine.sync_engine, "read")
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+ReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -29,14 +114,37 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    """Сессия для GET-запросов; в профиле sqlite_wal - из пула только для чтения"""
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        except Exception as e:
+            logger.error(f"Database session error: {e}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
 async def init_db():
-    from app.models.models_db import Base
-    
+    from app.models.models_db import Base, DataVersion
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    logger.info("База данных инициализирована")
+    try:
+        async with engine.begin() as conn:
+            result = await conn.execute(select(DataVersion.name).where(DataVersion.name == "currencies"))
+            if result.first() is None:
+                await conn.execute(insert(DataVersion).values(name="currencies", version=0, epoch=uuid.uuid4().hex))
+    except IntegrityError:
+        # Строку версии одновременно вставил другой воркер
+        pass
+    logger.info(f"База данных инициализирована (профиль {settings.DB_PROFILE})")
 
 
 async def close_db():
     await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
     logger.info("Закрыто соединение с БД")
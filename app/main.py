@@ -1,8 +1,11 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+import json
 import logging
+import msgpack
 from contextlib import asynccontextmanager
-from datetime import datetime
+from typing import List, Optional, Tuple
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,10 +14,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from app.app_config import settings
-from app.db.database import init_db, close_db
+from app.db.database import ReadSessionLocal, init_db, close_db
+from app.services.currency_service import CurrencyService
+from app.services.metrics import MetricsMiddleware, registry
 from app.services.nats_service import init_nats, close_nats
+from app.services.profiling import ProfilingMiddleware
+from app.services.upstream_client import init_upstream_client, close_upstream_client
+from app.services.rate_providers import init_rate_providers, close_rate_providers
+from app.services.write_behind import start_write_behind, stop_write_behind
 from app.tasks.background_task import start_background_task, stop_background_task
-from app.ws.ws_manager import manager
+from app.tasks.leader import start_leader_election, stop_leader_election
+from app.tasks.outbox_publisher import start_outbox_publisher, stop_outbox_publisher
+from app.ws.ws_manager import manager, negotiate_encoding, normalize_topic
+from app.ws.ws_fanout import start_ws_fanout, stop_ws_fanout
 from app.api.routes import router as api_router
 
 
@@ -29,6 +41,13 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Соединение NUTS профукано: {e}. Сегодня без него.")
     
+    await start_ws_fanout()
+    await init_upstream_client()
+    await init_rate_providers()
+    
+    await start_write_behind()
+    await start_leader_election()
+    await start_outbox_publisher()
     await start_background_task()
     
     logger.info("Приложение запущено")
@@ -38,6 +57,13 @@ async def lifespan(app: FastAPI):
     logger.info("Завершение работы...")
     
     await stop_background_task()
+    await stop_write_behind()
+    await stop_outbox_publisher()
+    await stop_leader_election()
+    await stop_ws_fanout()
+    await manager.close_all()
+    await close_rate_providers()
+    await close_upstream_client()
     await close_nats()
     await close_db()
     
@@ -58,29 +84,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router)
 
-@app.websocket("/ws/currencies")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+def _parse_topics(raw) -> Tuple[List[str], list]:
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    if not isinstance(raw, list):
+        return [], []
+    topics, invalid = [], []
+    for item in raw:
+        topic = normalize_topic(item) if isinstance(item, str) else None
+        if topic:
+            topics.append(topic)
+        else:
+            invalid.append(item)
+    return topics, invalid
+
+
+def _decode_ws_message(message: dict):
+    """Текстовый кадр - JSON, бинарный - MessagePack; мусор - None"""
+    try:
+        if message.get("text") is not None:
+            return json.loads(message["text"])
+        if message.get("bytes") is not None:
+            return msgpack.unpackb(message["bytes"])
+    except ValueError:
+        pass
+    return None
+
+
+async def _handle_ws_message(websocket: WebSocket, message):
+    # Всё, что не похоже на команду, считаем пингом (как раньше)
+    if not isinstance(message, dict) or message.get("action") in (None, "ping"):
+        await manager.send_personal(websocket, {
+            "event_type": "pong",
+            "data": {"message": "pong"}
+        })
+        return
+
+    action = message.get("action")
+    if action not in ("subscribe", "unsubscribe"):
+        await manager.send_personal(websocket, {
+            "event_type": "error",
+            "data": {"message": f"Unknown action: {action}"}
+        })
+        return
+
+    topics, invalid = _parse_topics(message.get("pairs"))
+    if invalid or not topics:
+        await manager.send_personal(websocket, {
+            "event_type": "error",
+            "data": {"message": "Invalid pairs", "pairs": invalid}
+        })
+        return
+
+    if action == "subscribe":
+        current = manager.subscribe(websocket, topics)
+    else:
+        current = manager.unsubscribe(websocket, topics)
 
     await manager.send_personal(websocket, {
-        "event_type": "connected",
-        "data": {
-            "message": "Connected to currency updates",
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        "event_type": f"{action}d",
+        "data": {"pairs": current}
     })
+
+
+def _parse_resume(websocket: WebSocket) -> Optional[Tuple[Optional[str], int]]:
+    """?stream=<id>&last_seq=<n> - догонка после переподключения; last_seq=0 без stream - снимок"""
+    last_seq = websocket.query_params.get("last_seq")
+    if last_seq is None:
+        return None
+    try:
+        return websocket.query_params.get("stream"), int(last_seq)
+    except ValueError:
+        return None, -1
+
+
+@app.websocket("/ws/currencies")
+async def websocket_endpoint(websocket: WebSocket):
+    topics, _ = _parse_topics(websocket.query_params.get("pairs", ""))
+    encoding, subprotocol = negotiate_encoding(
+        websocket.scope.get("subprotocols", []),
+        websocket.query_params.get("encoding")
+    )
+    resume = _parse_resume(websocket)
+    if resume is not None and not CurrencyService.snapshot.loaded:
+        # Снимок может понадобиться, если клиент не догонится из буфера
+        async with ReadSessionLocal() as session:
+            await CurrencyService.load_snapshot(session)
+    await manager.connect(websocket, topics, encoding, subprotocol, resume)
     
     try:
         while True:
-            data = await websocket.receive_text()
-            logger.debug(f"Получено от клиента: {data}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            logger.debug(f"Получено от клиента: {message}")
             
-            await manager.send_personal(websocket, {
-                "event_type": "pong",
-                "data": {"message": "pong"}
-            })
+            await _handle_ws_message(websocket, _decode_ws_message(message))
     
     except WebSocketDisconnect:
         await manager.disconnect(websocket)
@@ -105,6 +212,13 @@ async def readiness():
     return {"status": "ready"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
+import uuid
 from datetime import datetime
 
 Base = declarative_base()
@@ -14,8 +15,79 @@ class Currency(Base):
     base = Column(String(3), nullable=False, index=True)
     target = Column(String(3), nullable=False, index=True)
     current_rate = Column(Float, nullable=False)
-    last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     is_active = Column(Boolean, default=True)
     
     def __repr__(self):
         return f"<Currency {self.base}/{self.target} = {self.current_rate}>"
+
+
+class CurrencyRateHistory(Base):
+    """История изменений курса валютной пары (только добавление)"""
+    
+    __tablename__ = "currency_rate_history"
+    __table_args__ = (
+        Index("ix_rate_history_pair_time", "base", "target", "recorded_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    base = Column(String(3), nullable=False)
+    target = Column(String(3), nullable=False)
+    rate = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CurrencyRateHistory {self.base}/{self.target} = {self.rate} @ {self.recorded_at}>"
+
+
+class OutboxEvent(Base):
+    """Событие для NATS, записанное в одной транзакции с изменением данных"""
+    
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True)
+    subject = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<OutboxEvent #{self.id} {self.subject}>"
+
+
+class OutboxOffset(Base):
+    """Последнее доставленное событие outbox для потребителя"""
+    
+    __tablename__ = "outbox_offsets"
+    
+    consumer = Column(String(50), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DataVersion(Base):
+    """Счётчик изменений данных: растёт в каждой транзакции записи, по нему процессы сверяют снимки"""
+    
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Эпоха базы: после её пересоздания версии начинаются заново и не должны совпасть со старыми ETag
+    epoch = Column(String(32), nullable=False, default=lambda: uuid.uuid4().hex)
+    
+    def __repr__(self):
+        return f"<DataVersion {self.name} = {self.version}>"
+
+
+class LeaderLease(Base):
+    """Аренда лидерства: фоновые задачи выполняет только держатель непросроченной аренды"""
+    
+    __tablename__ = "leader_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100), nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    run_requested = Column(Boolean, nullable=False, default=False)
+    
+    def __repr__(self):
+        return f"<LeaderLease {self.name}: {self.holder} до {self.expires_at}>"
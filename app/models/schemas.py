@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class CurrencyBase(BaseModel):
@@ -28,12 +28,105 @@ class CurrencyResponse(CurrencyBase):
         from_attributes = True
 
 
+class CurrencyFieldsResponse(BaseModel):
+    """Пара в списке: с параметром fields присутствуют только запрошенные поля"""
+    id: Optional[int] = None
+    base: Optional[str] = None
+    target: Optional[str] = None
+    current_rate: Optional[float] = None
+    last_updated: Optional[datetime] = None
+    is_active: Optional[bool] = None
+
+
+class CurrencyBulkCreate(BaseModel):
+    items: List[CurrencyCreate] = Field(..., min_length=1)
+
+
+class CurrencyBulkUpdateItem(CurrencyUpdate):
+    id: int
+
+
+class CurrencyBulkUpdate(BaseModel):
+    items: List[CurrencyBulkUpdateItem] = Field(..., min_length=1)
+
+
+class CurrencyBulkDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+
+class BulkItemResult(BaseModel):
+    index: int = Field(..., description="Позиция элемента в запросе")
+    id: Optional[int] = None
+    status: str = Field(..., description="created, updated, deleted или not_found")
+    currency: Optional[CurrencyResponse] = None
+
+
+class BulkResponse(BaseModel):
+    items: List[BulkItemResult]
+
+
+class LeaderStatus(BaseModel):
+    instance_id: str = Field(..., description="Этот процесс")
+    is_leader: bool
+    leader_id: Optional[str] = Field(None, description="Процесс, выполняющий фоновые задачи")
+    lease_expires_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+
 class TaskStatus(BaseModel):
-    status: str = Field(..., description="Статус задачи: pending, running, completed, failed")
+    status: str = Field(..., description="Статус задачи: pending, running, completed, partial, failed, standby")
     last_run: Optional[datetime] = Field(None, description="Время последнего запуска")
     next_run: Optional[datetime] = Field(None, description="Время следующего запуска")
     total_runs: int = Field(0, description="Всего запусков")
     last_error: Optional[str] = Field(None, description="Последняя ошибка")
+    leader: Optional[LeaderStatus] = None
+
+
+class RateCandle(BaseModel):
+    timestamp: datetime = Field(..., description="Начало интервала")
+    open: float
+    high: float
+    low: float
+    close: float
+    count: int = Field(..., description="Количество изменений курса в интервале")
+
+
+class RateHistoryResponse(BaseModel):
+    base: str
+    target: str
+    resolution: int = Field(..., description="Размер интервала в секундах")
+    start: datetime
+    end: datetime
+    candles: List[RateCandle]
+
+
+class RatePoint(BaseModel):
+    base: str
+    target: str
+    rate: float
+    recorded_at: datetime
+
+
+class ConversionItem(BaseModel):
+    source: str = Field(..., alias="from", min_length=3, max_length=3)
+    target: str = Field(..., alias="to", min_length=3, max_length=3)
+    amount: float = Field(..., ge=0)
+    
+    class Config:
+        populate_by_name = True
+
+
+class ConversionResult(ConversionItem):
+    rate: Optional[float] = Field(None, description="Кросс-курс, null если пути между валютами нет")
+    result: Optional[float] = None
+
+
+class ConversionBatchRequest(BaseModel):
+    items: List[ConversionItem]
+
+
+class ConversionBatchResponse(BaseModel):
+    items: List[ConversionResult]
 
 
 class WebSocketMessage(BaseModel):
@@ -26,6 +26,10 @@ async def main():
             data = json.loads(msg.data.decode())
             logger.info(f"❌ УДАЛЕНА валюта: {data}")
         
+        async def on_currency_bulk(msg):
+            data = json.loads(msg.data.decode())
+            logger.info(f"📦 ПАКЕТ {data['event_type']}: {len(data['data'])} валют")
+        
         async def on_task_completed(msg):
             data = json.loads(msg.data.decode())
             logger.info(f"⚡ ЗАДАЧА ЗАВЕРШЕНА: {data}")
@@ -33,6 +37,7 @@ async def main():
         await nc.subscribe("currency.created", cb=on_currency_created)
         await nc.subscribe("currency.updated", cb=on_currency_updated)
         await nc.subscribe("currency.deleted", cb=on_currency_deleted)
+        await nc.subscribe("currency.bulk.*", cb=on_currency_bulk)
         await nc.subscribe("task.completed", cb=on_task_completed)
         
         logger.info("Подписан на все уведомления изменения валют")
@@ -0,0 +1,59 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import math
+from typing import List, Optional, Sequence
+
+from app.models.schemas import ConversionItem, ConversionResult
+from app.services.currency_service import CurrencyService
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionService:
+    @staticmethod
+    async def convert(
+        session: AsyncSession,
+        source: str,
+        target: str,
+        amount: float
+    ) -> Optional[ConversionResult]:
+        if not await CurrencyService.load_snapshot(session):
+            return None
+        rate = CurrencyService.rate_matrix.rate(source, target)
+        if rate is None:
+            return None
+        return ConversionResult(
+            source=source.upper(),
+            target=target.upper(),
+            amount=amount,
+            rate=rate,
+            result=amount * rate
+        )
+
+    @staticmethod
+    async def convert_batch(
+        session: AsyncSession,
+        items: Sequence[ConversionItem]
+    ) -> Optional[List[dict]]:
+        if not await CurrencyService.load_snapshot(session):
+            return None
+        if not items:
+            return []
+
+        sources = [item.source for item in items]
+        targets = [item.target for item in items]
+        amounts = [item.amount for item in items]
+        rates, results = CurrencyService.rate_matrix.convert(sources, targets, amounts)
+
+        return [
+            {
+                "from": source.upper(),
+                "to": target.upper(),
+                "amount": amount,
+                "rate": None if math.isnan(rate) else rate,
+                "result": None if math.isnan(result) else result
+            }
+            for source, target, amount, rate, result in zip(
+                sources, targets, amounts, rates.tolist(), results.tolist()
+            )
+        ]
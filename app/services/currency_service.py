@@ -1,37 +1,169 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, update
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 import logging
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from app.models.models_db import Currency
-from app.models.schemas import CurrencyCreate, CurrencyUpdate
+from app.models.models_db import Currency, CurrencyRateHistory, DataVersion
+from app.models.schemas import CurrencyCreate, CurrencyResponse, CurrencyUpdate
+from app.services.events import currency_batch_event, currency_events, event_bus, loads
+from app.services.outbox import add_outbox_events, notify_outbox
+from app.services.rate_matrix import RateMatrix
+from app.services.rate_snapshot import RateSnapshot
+from app.app_config import settings
 
 logger = logging.getLogger(__name__)
 
+BULK_INSERT_CHUNK = 500
+CURRENCY_FIELDS = tuple(CurrencyResponse.model_fields)
+DATA_VERSION_KEY = "currencies"
+
+
+class CurrencyService:
+    snapshot = RateSnapshot()
+    rate_matrix = RateMatrix()
+    snapshot.add_listener(rate_matrix)
 
-class CurrencyService:    
     @staticmethod
-    async def get_all(session: AsyncSession) -> List[Currency]:
+    async def load_snapshot(session: AsyncSession) -> bool:
+        """Загружает снимок при первом чтении и перечитывает, если БД менял другой процесс.
+
+        Версия данных в БД сверяется не чаще раза в SNAPSHOT_CHECK_INTERVAL секунд:
+        без рассылки событий между воркерами это предел устаревания снимка.
+        """
+        snapshot = CurrencyService.snapshot
         try:
-            result = await session.execute(
-                select(Currency).where(Currency.is_active == True)
-            )
-            return result.scalars().all()
+            if snapshot.loaded and snapshot.check_due(settings.SNAPSHOT_CHECK_INTERVAL):
+                _, data_version = await CurrencyService._data_version(session)
+                if data_version != snapshot.data_version:
+                    logger.info("Данные изменены другим процессом, перечитываем снимок")
+                    snapshot.invalidate()
+            while not snapshot.loaded:
+                version = snapshot.version
+                # Версию читаем до строк: запись между ними даст лишнюю перезагрузку, но не устаревший снимок
+                data_epoch, data_version = await CurrencyService._data_version(session)
+                result = await session.execute(select(Currency))
+                currencies = result.scalars().all()
+                # Запись успела закоммититься во время чтения - перечитываем
+                if snapshot.version == version:
+                    snapshot.load(currencies, data_version, data_epoch)
+            return True
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка получения валют: {e}")
-            return []
-    
+            logger.error(f"Ошибка загрузки снимка курсов: {e}")
+            return False
+
+    @staticmethod
+    def apply_remote_events(payloads: List[bytes], data_version: Optional[int]):
+        """События записи другого воркера - в снимок, не дожидаясь сверки с БД.
+
+        created/updated несут пару целиком (кроме is_active, он берётся из снимка);
+        в событиях удаления только id, поэтому они перечитывают снимок.
+        """
+        snapshot = CurrencyService.snapshot
+        items = []
+        for payload in payloads:
+            message = loads(payload)
+            kind = message.get("event_type", "")
+            if not kind.endswith(("created", "updated")):
+                snapshot.invalidate()
+                return
+            records = message["data"] if kind.startswith("bulk_") else [message["data"]]
+            for record in records:
+                previous = snapshot.get(record["id"])
+                items.append({**record, "is_active": previous.is_active if previous else True})
+        snapshot.apply_remote(items, data_version)
+
     @staticmethod
-    async def get_by_id(session: AsyncSession, currency_id: int) -> Optional[Currency]:
+    async def _data_version(session: AsyncSession) -> Tuple[Optional[str], Optional[int]]:
+        """Эпоха и версия данных в БД"""
+        result = await session.execute(
+            select(DataVersion.epoch, DataVersion.version).where(DataVersion.name == DATA_VERSION_KEY)
+        )
+        row = result.first()
+        return (row.epoch, row.version) if row else (None, None)
+
+    @staticmethod
+    async def _stage_change(session: AsyncSession, events) -> Optional[int]:
+        """Сдвигает версию данных и кладёт события в outbox текущей транзакции.
+
+        Возвращает новую версию для снимка; коммитит вызывающий.
+        """
+        result = await session.execute(
+            update(DataVersion)
+            .where(DataVersion.name == DATA_VERSION_KEY)
+            .values(version=DataVersion.version + 1)
+            .returning(DataVersion.version)
+        )
+        await add_outbox_events(session, events)
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_all(
+        session: AsyncSession,
+        base: Optional[str] = None,
+        target: Optional[str] = None,
+        updated_since: Optional[datetime] = None,
+        include_inactive: bool = False,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None
+    ) -> Optional[Tuple[List[dict], Optional[int]]]:
+        """Страница пар по фильтрам: (строки, курсор следующей страницы или None).
+
+        Фильтры и keyset по id выполняются в SQL, fields сужает выборку колонок.
+        """
+        fields = list(fields or CURRENCY_FIELDS)
+        columns = [getattr(Currency, field) for field in fields]
+        if "id" not in fields:
+            columns.append(Currency.id)
+
+        query = select(*columns).order_by(Currency.id)
+        if not include_inactive:
+            query = query.where(Currency.is_active == True)
+        if base:
+            query = query.where(Currency.base == base.upper())
+        if target:
+            query = query.where(Currency.target == target.upper())
+        if updated_since:
+            query = query.where(Currency.last_updated >= updated_since)
+        if after_id is not None:
+            query = query.where(Currency.id > after_id)
+        if limit:
+            # Лишняя строка говорит, есть ли следующая страница
+            query = query.limit(limit + 1)
+
         try:
-            result = await session.execute(
-                select(Currency).where(Currency.id == currency_id)
-            )
-            return result.scalar_one_or_none()
+            result = await session.execute(query)
+            rows = result.all()
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка получения валюты по id: {e}")
+            logger.error(f"Ошибка получения валют: {e}")
             return None
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].id
+        return [{field: row._mapping[field] for field in fields} for row in rows], next_cursor
+
+    @staticmethod
+    async def get_all_json(session: AsyncSession) -> bytes:
+        if not await CurrencyService.load_snapshot(session):
+            return b"[]"
+        return CurrencyService.snapshot.list_body()
+    
+    @staticmethod
+    async def get_by_id(session: AsyncSession, currency_id: int) -> Optional[CurrencyResponse]:
+        if not await CurrencyService.load_snapshot(session):
+            return None
+        return CurrencyService.snapshot.get(currency_id)
+
+    @staticmethod
+    async def get_by_id_json(session: AsyncSession, currency_id: int) -> Optional[bytes]:
+        if not await CurrencyService.load_snapshot(session):
+            return None
+        return CurrencyService.snapshot.item_body(currency_id)
     
     @staticmethod
     async def create(session: AsyncSession, currency: CurrencyCreate) -> Optional[Currency]:
@@ -42,8 +174,19 @@ class CurrencyService:
                 current_rate=currency.current_rate
             )
             session.add(db_currency)
+            session.add(CurrencyRateHistory(
+                base=db_currency.base,
+                target=db_currency.target,
+                rate=db_currency.current_rate
+            ))
+            await session.flush()
+            events = currency_events("created", [db_currency])
+            data_version = await CurrencyService._stage_change(session, events)
             await session.commit()
             await session.refresh(db_currency)
+            CurrencyService.snapshot.put(db_currency, data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
             logger.info(f"Создана валюта: {db_currency}")
             return db_currency
         except SQLAlchemyError as e:
@@ -73,8 +216,21 @@ class CurrencyService:
             if currency.current_rate:
                 db_currency.current_rate = currency.current_rate
             
+            if currency.current_rate or currency.base or currency.target:
+                session.add(CurrencyRateHistory(
+                    base=db_currency.base,
+                    target=db_currency.target,
+                    rate=db_currency.current_rate
+                ))
+            
+            await session.flush()
+            events = currency_events("updated", [db_currency])
+            data_version = await CurrencyService._stage_change(session, events)
             await session.commit()
             await session.refresh(db_currency)
+            CurrencyService.snapshot.put(db_currency, data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
             logger.info(f"Обновленная валюта: {db_currency}")
             return db_currency
         except SQLAlchemyError as e:
@@ -83,7 +239,169 @@ class CurrencyService:
             return None
     
     @staticmethod
-    async def delete(session: AsyncSession, currency_id: int) -> bool:
+    async def update_many(
+        session: AsyncSession,
+        updates: Dict[int, CurrencyUpdate],
+        batch_event: bool = False
+    ) -> Optional[Dict[int, Currency]]:
+        """Применяет изменения нескольких пар одной транзакцией.
+
+        События - по одному на пару или, с batch_event, одно на всю пачку.
+        Возвращает {id: валюта} для найденных пар, None при ошибке БД.
+        """
+        if not updates:
+            return {}
+
+        try:
+            result = await session.execute(
+                select(Currency).where(Currency.id.in_(updates))
+            )
+            currencies = {currency.id: currency for currency in result.scalars().all()}
+
+            history = []
+            for currency_id, db_currency in currencies.items():
+                currency = updates[currency_id]
+                if currency.base:
+                    db_currency.base = currency.base.upper()
+                if currency.target:
+                    db_currency.target = currency.target.upper()
+                if currency.current_rate:
+                    db_currency.current_rate = currency.current_rate
+
+                if currency.current_rate or currency.base or currency.target:
+                    history.append({
+                        "base": db_currency.base,
+                        "target": db_currency.target,
+                        "rate": db_currency.current_rate
+                    })
+
+            if not currencies:
+                return {}
+
+            await session.flush()
+            if history:
+                await session.execute(insert(CurrencyRateHistory), history)
+            if batch_event:
+                events = [currency_batch_event("updated", list(currencies.values()))]
+            else:
+                events = currency_events("updated", currencies.values())
+            data_version = await CurrencyService._stage_change(session, events)
+            await session.commit()
+            CurrencyService.snapshot.put_many(currencies.values(), data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
+            logger.info(f"Обновлено валют одной транзакцией: {len(currencies)}")
+            return currencies
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка обновления валют: {e}")
+            await session.rollback()
+            return None
+    
+    @staticmethod
+    async def bulk_create(
+        session: AsyncSession,
+        currencies: List[CurrencyCreate]
+    ) -> Optional[List[Currency]]:
+        """Создаёт пары одной транзакцией с одним событием на пачку; порядок как во входе"""
+        if not currencies:
+            return []
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                "base": currency.base.upper(),
+                "target": currency.target.upper(),
+                "current_rate": currency.current_rate,
+                "last_updated": now,
+                "is_active": True
+            }
+            for currency in currencies
+        ]
+
+        try:
+            created = []
+            for i in range(0, len(rows), BULK_INSERT_CHUNK):
+                chunk = rows[i:i + BULK_INSERT_CHUNK]
+                result = await session.execute(
+                    insert(Currency)
+                    .values(chunk)
+                    .returning(Currency.id, Currency.base, Currency.target, Currency.current_rate)
+                )
+                # RETURNING не гарантирует порядок строк - сопоставляем по содержимому;
+                # пары во входе могут повторяться, совпадающие целиком строки взаимозаменяемы
+                ids: Dict[Tuple[str, str, float], List[int]] = {}
+                for row in result:
+                    ids.setdefault((row.base, row.target, row.current_rate), []).append(row.id)
+                created.extend(
+                    Currency(id=ids[(row["base"], row["target"], row["current_rate"])].pop(0), **row)
+                    for row in chunk
+                )
+
+            await session.execute(
+                insert(CurrencyRateHistory),
+                [
+                    {
+                        "base": currency.base,
+                        "target": currency.target,
+                        "rate": currency.current_rate,
+                        "recorded_at": now
+                    }
+                    for currency in created
+                ]
+            )
+
+            events = [currency_batch_event("created", created)]
+            data_version = await CurrencyService._stage_change(session, events)
+            await session.commit()
+            CurrencyService.snapshot.put_many(created, data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
+            logger.info(f"Создано валют пачкой: {len(created)}")
+            return created
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка пакетного создания валют: {e}")
+            await session.rollback()
+            return None
+
+    @staticmethod
+    async def bulk_delete(
+        session: AsyncSession,
+        currency_ids: List[int]
+    ) -> Optional[Dict[int, Currency]]:
+        """Мягко удаляет пары одной транзакцией с одним событием на пачку"""
+        if not currency_ids:
+            return {}
+
+        try:
+            result = await session.execute(
+                select(Currency).where(
+                    (Currency.id.in_(set(currency_ids))) &
+                    (Currency.is_active == True)
+                )
+            )
+            currencies = {currency.id: currency for currency in result.scalars().all()}
+            if not currencies:
+                return {}
+
+            for db_currency in currencies.values():
+                db_currency.is_active = False
+            await session.flush()
+
+            events = [currency_batch_event("deleted", list(currencies.values()))]
+            data_version = await CurrencyService._stage_change(session, events)
+            await session.commit()
+            CurrencyService.snapshot.put_many(currencies.values(), data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
+            logger.info(f"Удалено валют пачкой: {len(currencies)}")
+            return currencies
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка пакетного удаления валют: {e}")
+            await session.rollback()
+            return None
+    
+    @staticmethod
+    async def delete(session: AsyncSession, currency_id: int) -> Optional[Currency]:
         try:
             result = await session.execute(
                 select(Currency).where(Currency.id == currency_id)
@@ -91,32 +409,123 @@ class CurrencyService:
             db_currency = result.scalar_one_or_none()
             
             if not db_currency:
-                return False
+                return None
             
             db_currency.is_active = False
+            await session.flush()
+            events = currency_events("deleted", [db_currency])
+            data_version = await CurrencyService._stage_change(session, events)
             await session.commit()
+            CurrencyService.snapshot.put(db_currency, data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
             logger.info(f"Удалена валюта с id: {currency_id}")
-            return True
+            return db_currency
         except SQLAlchemyError as e:
             logger.error(f"Ошибка удаления валюты: {e}")
             await session.rollback()
-            return False
+            return None
     
     @staticmethod
     async def get_by_pair(
         session: AsyncSession,
         base: str,
         target: str
-    ) -> Optional[Currency]:
+    ) -> Optional[CurrencyResponse]:
+        if not await CurrencyService.load_snapshot(session):
+            return None
+        return CurrencyService.snapshot.get_pair(base, target)
+
+    @staticmethod
+    async def bulk_upsert_rates(
+        session: AsyncSession,
+        rates: Dict[Tuple[str, str], float]
+    ) -> Optional[Tuple[List[Currency], List[Currency]]]:
+        """Обновляет/создаёт пары одной транзакцией, возвращает (созданные, обновлённые)"""
+        if not rates:
+            return [], []
+
+        rates = {
+            (base.upper(), target.upper()): rate
+            for (base, target), rate in rates.items()
+        }
+        bases = {base for base, _ in rates}
+        targets = {target for _, target in rates}
+
         try:
             result = await session.execute(
                 select(Currency).where(
-                    (Currency.base == base.upper()) &
-                    (Currency.target == target.upper()) &
+                    (Currency.base.in_(bases)) &
+                    (Currency.target.in_(targets)) &
                     (Currency.is_active == True)
                 )
             )
-            return result.scalar_one_or_none()
+            existing = {
+                (currency.base, currency.target): currency
+                for currency in result.scalars().all()
+            }
+
+            now = datetime.utcnow()
+            new_rows, updated = [], []
+            for pair, rate in rates.items():
+                db_currency = existing.get(pair)
+                if db_currency is None:
+                    new_rows.append({
+                        "base": pair[0],
+                        "target": pair[1],
+                        "current_rate": rate,
+                        "last_updated": now,
+                        "is_active": True
+                    })
+                elif db_currency.current_rate != rate:
+                    db_currency.current_rate = rate
+                    db_currency.last_updated = now
+                    updated.append(db_currency)
+
+            if not new_rows and not updated:
+                return [], []
+
+            # Изменённые строки уходят одним executemany UPDATE при flush
+            await session.flush()
+
+            # Новые - многострочным INSERT ... RETURNING, id сопоставляем по паре
+            created = []
+            for i in range(0, len(new_rows), BULK_INSERT_CHUNK):
+                chunk = new_rows[i:i + BULK_INSERT_CHUNK]
+                result = await session.execute(
+                    insert(Currency)
+                    .values(chunk)
+                    .returning(Currency.id, Currency.base, Currency.target)
+                )
+                ids = {(row.base, row.target): row.id for row in result}
+                created.extend(
+                    Currency(id=ids[(row["base"], row["target"])], **row)
+                    for row in chunk
+                )
+
+            await session.execute(
+                insert(CurrencyRateHistory),
+                [
+                    {
+                        "base": currency.base,
+                        "target": currency.target,
+                        "rate": currency.current_rate,
+                        "recorded_at": now
+                    }
+                    for currency in created + updated
+                ]
+            )
+
+            events = currency_events("created", created) + currency_events("updated", updated)
+            data_version = await CurrencyService._stage_change(session, events)
+
+            await session.commit()
+            CurrencyService.snapshot.put_many(created + updated, data_version)
+            event_bus.publish(events, data_version)
+            notify_outbox()
+            logger.info(f"Пакетное обновление: создано {len(created)}, обновлено {len(updated)}")
+            return created, updated
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка получения валютной пары: {e}")
+            logger.error(f"Ошибка пакетного обновления валют: {e}")
+            await session.rollback()
             return None
@@ -0,0 +1,156 @@
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import msgpack
+import orjson
+
+from app.models.models_db import Currency
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(obj: Any) -> bytes:
+    """Единый JSON-кодировщик: REST, WebSocket и NATS"""
+    return orjson.dumps(obj)
+
+
+def loads(data) -> Any:
+    return orjson.loads(data)
+
+
+class Event:
+    """Событие, закодированное один раз: одни и те же байты уходят в NATS и WebSocket.
+
+    Бинарная форма (MessagePack) строится лениво при первом запросе и кэшируется:
+    одно кодирование на формат, а не на клиента.
+    """
+
+    __slots__ = ("id", "kind", "subject", "pairs", "payload", "seq", "_text", "_binary")
+
+    def __init__(self, event_id: str, kind: str, subject: str, pairs: Tuple[str, ...], payload: bytes):
+        self.id = event_id
+        self.kind = kind
+        self.subject = subject
+        # Пары для фильтрации подписок WebSocket; пустой кортеж - всем клиентам
+        self.pairs = pairs
+        self.payload = payload
+        # Номер в рассылке WebSocket, см. EventStream
+        self.seq: Optional[int] = None
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+
+    @classmethod
+    def from_message(cls, message: dict, pairs: Tuple[str, ...] = ()) -> "Event":
+        """Служебное сообщение WebSocket (pong, connected, ...) в той же обёртке"""
+        return cls(message.get("event_id", ""), message.get("event_type", ""), "", pairs, dumps(message))
+
+    def with_seq(self, seq: int) -> "Event":
+        """Копия с полем seq в начале конверта: вставка в байты, без перекодирования"""
+        event = Event(self.id, self.kind, self.subject, self.pairs, b'{"seq":%d,' % seq + self.payload[1:])
+        event.seq = seq
+        return event
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.payload.decode()
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = msgpack.packb(loads(self.payload))
+        return self._binary
+
+
+def currency_data(currency: Currency) -> dict:
+    return {
+        "id": currency.id,
+        "base": currency.base,
+        "target": currency.target,
+        "current_rate": currency.current_rate,
+        "last_updated": currency.last_updated.isoformat()
+    }
+
+
+def currency_event(kind: str, currency: Currency, timestamp: Optional[str] = None) -> Event:
+    """created / updated / deleted.
+
+    Конверт совместим с обоими потребителями: event_type + data для WebSocket,
+    event (+ currency_id для удаления) для подписчиков NATS. event_id позволяет
+    отбрасывать повторы.
+    """
+    timestamp = timestamp or datetime.utcnow().isoformat()
+    event_id = uuid.uuid4().hex
+    if kind == "deleted":
+        message = {
+            "event_id": event_id,
+            "event_type": kind,
+            "event": "currency_deleted",
+            "data": {"id": currency.id},
+            "currency_id": currency.id,
+            "timestamp": timestamp
+        }
+    else:
+        message = {
+            "event_id": event_id,
+            "event_type": kind,
+            "event": f"currency_{kind}",
+            "data": currency_data(currency),
+            "timestamp": timestamp
+        }
+    return Event(
+        event_id,
+        kind,
+        f"currency.{kind}",
+        (f"{currency.base}/{currency.target}",),
+        dumps(message)
+    )
+
+
+def currency_events(kind: str, currencies: Iterable[Currency]) -> List[Event]:
+    timestamp = datetime.utcnow().isoformat()
+    return [currency_event(kind, currency, timestamp) for currency in currencies]
+
+
+def currency_batch_event(kind: str, currencies: List[Currency]) -> Event:
+    """Одно событие на пачку пар: bulk_created / bulk_updated / bulk_deleted в currency.bulk.<kind>"""
+    event_id = uuid.uuid4().hex
+    if kind == "deleted":
+        data = [{"id": currency.id} for currency in currencies]
+    else:
+        data = [currency_data(currency) for currency in currencies]
+    message = {
+        "event_id": event_id,
+        "event_type": f"bulk_{kind}",
+        "event": f"currency_bulk_{kind}",
+        "data": data,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    pairs = tuple(dict.fromkeys(f"{currency.base}/{currency.target}" for currency in currencies))
+    return Event(event_id, f"bulk_{kind}", f"currency.bulk.{kind}", pairs, dumps(message))
+
+
+class EventBus:
+    """Шина событий процесса: сервисы публикуют после коммита, доставщики подписываются"""
+
+    def __init__(self):
+        self._handlers: List[Callable[[List[Event], Optional[int]], None]] = []
+
+    def subscribe(self, handler: Callable[[List[Event], Optional[int]], None]):
+        self._handlers.append(handler)
+
+    def publish(self, events: List[Event], data_version: Optional[int] = None):
+        """data_version - версия данных после транзакции, в которой возникли события"""
+        if not events:
+            return
+        for handler in self._handlers:
+            try:
+                handler(events, data_version)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика событий: {e}")
+
+
+event_bus = EventBus()
@@ -0,0 +1,85 @@
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.models_db import Currency, CurrencyRateHistory
+from app.services.events import dumps
+
+CURRENCY_EXPORT_FIELDS = ("id", "base", "target", "current_rate", "last_updated", "is_active")
+HISTORY_EXPORT_FIELDS = ("id", "base", "target", "rate", "recorded_at")
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class ExportService:
+    """Выгрузка таблиц курсором на стороне сервера.
+
+    Строки читаются пачками по chunk_size (yield_per) и сразу кодируются:
+    в памяти одновременно живёт одна пачка, сколько бы строк ни было в таблице.
+    """
+
+    @staticmethod
+    async def currencies(
+        session: AsyncSession,
+        include_inactive: bool = False,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[Sequence]:
+        query = select(*(getattr(Currency, field) for field in CURRENCY_EXPORT_FIELDS)).order_by(Currency.id)
+        if not include_inactive:
+            query = query.where(Currency.is_active == True)
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
+    @staticmethod
+    async def history(
+        session: AsyncSession,
+        base: Optional[str] = None,
+        target: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[Sequence]:
+        query = select(
+            *(getattr(CurrencyRateHistory, field) for field in HISTORY_EXPORT_FIELDS)
+        ).order_by(CurrencyRateHistory.id)
+        if base:
+            query = query.where(CurrencyRateHistory.base == base.upper())
+        if target:
+            query = query.where(CurrencyRateHistory.target == target.upper())
+        if since:
+            query = query.where(CurrencyRateHistory.recorded_at >= since)
+        if until:
+            query = query.where(CurrencyRateHistory.recorded_at < until)
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
+    @staticmethod
+    def header(fields: Sequence[str], format: str) -> bytes:
+        if format != "csv":
+            return b""
+        return ExportService._csv_rows([fields])
+
+    @staticmethod
+    def encode(rows: Sequence, fields: Sequence[str], format: str) -> bytes:
+        if format == "csv":
+            return ExportService._csv_rows([_csv_value(value) for value in row] for row in rows)
+        return b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+    @staticmethod
+    def _csv_rows(rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode()
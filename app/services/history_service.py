@@ -0,0 +1,97 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from app.models.models_db import CurrencyRateHistory
+from app.models.schemas import RateCandle, RatePoint
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _bucket_start(moment: datetime, resolution: int) -> datetime:
+    seconds = int((moment - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+class HistoryService:
+    @staticmethod
+    async def get_candles(
+        session: AsyncSession,
+        base: str,
+        target: str,
+        start: datetime,
+        end: datetime,
+        resolution: int
+    ) -> Optional[List[RateCandle]]:
+        """OHLC-свечи за [start, end), тики агрегируются потоково и наружу не уходят"""
+        try:
+            result = await session.stream(
+                select(CurrencyRateHistory.recorded_at, CurrencyRateHistory.rate)
+                .where(
+                    (CurrencyRateHistory.base == base.upper()) &
+                    (CurrencyRateHistory.target == target.upper()) &
+                    (CurrencyRateHistory.recorded_at >= start) &
+                    (CurrencyRateHistory.recorded_at < end)
+                )
+                .order_by(CurrencyRateHistory.recorded_at)
+                .execution_options(yield_per=1000)
+            )
+
+            candles: List[RateCandle] = []
+            current: Optional[RateCandle] = None
+            async for recorded_at, rate in result:
+                bucket = _bucket_start(recorded_at, resolution)
+                if current is None or current.timestamp != bucket:
+                    current = RateCandle(
+                        timestamp=bucket,
+                        open=rate,
+                        high=rate,
+                        low=rate,
+                        close=rate,
+                        count=0
+                    )
+                    candles.append(current)
+                current.high = max(current.high, rate)
+                current.low = min(current.low, rate)
+                current.close = rate
+                current.count += 1
+            return candles
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка получения истории курса: {e}")
+            return None
+
+    @staticmethod
+    async def get_rate_at(
+        session: AsyncSession,
+        base: str,
+        target: str,
+        moment: datetime
+    ) -> Optional[RatePoint]:
+        try:
+            result = await session.execute(
+                select(CurrencyRateHistory)
+                .where(
+                    (CurrencyRateHistory.base == base.upper()) &
+                    (CurrencyRateHistory.target == target.upper()) &
+                    (CurrencyRateHistory.recorded_at <= moment)
+                )
+                .order_by(CurrencyRateHistory.recorded_at.desc())
+                .limit(1)
+            )
+            row = result.scalar_one_or_none()
+            if not row:
+                return None
+            return RatePoint(
+                base=row.base,
+                target=row.target,
+                rate=row.rate,
+                recorded_at=row.recorded_at
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка получения курса на момент времени: {e}")
+            return None
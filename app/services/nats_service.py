@@ -1,9 +1,12 @@
 from nats.aio.client import Client
 import logging
-import json
-from typing import Callable, Optional
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from app.services.events import dumps, loads
+from app.services.metrics import NATS_PUBLISH_DURATION, NATS_PUBLISH_ERRORS
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,23 +37,61 @@ class NATSService:
             logger.warning("NATS не подключен")
             return
         
+        started = time.perf_counter()
         try:
-            payload = json.dumps(message).encode()
+            payload = dumps(message)
             await self.nc.publish(subject, payload)
+            NATS_PUBLISH_DURATION.labels("publish").observe(time.perf_counter() - started)
             logger.debug(f"Опубликовано в {subject}: {message}")
         except Exception as e:
+            NATS_PUBLISH_ERRORS.labels("publish").inc()
             logger.error(f"Ошибка публикации: {e}")
     
-    async def subscribe(self, subject: str, callback: Callable):
+    async def publish_many(self, messages: List[Tuple[str, bytes]]):
+        """Публикует готовые payload'ы одной пачкой; в отличие от publish, ошибки пробрасывает"""
+        if not self.nc or not self.nc.is_connected:
+            NATS_PUBLISH_ERRORS.labels("publish_many").inc()
+            raise ConnectionError("NATS не подключен")
+        
+        started = time.perf_counter()
+        try:
+            for subject, payload in messages:
+                await self.nc.publish(subject, payload)
+            await self.nc.flush()
+        except Exception:
+            NATS_PUBLISH_ERRORS.labels("publish_many").inc()
+            raise
+        NATS_PUBLISH_DURATION.labels("publish_many").observe(time.perf_counter() - started)
+        logger.debug(f"Опубликовано сообщений: {len(messages)}")
+    
+    async def publish_raw(self, subject: str, payload: bytes, headers: Optional[Dict[str, str]] = None):
+        """Готовый payload без flush; ошибки пробрасывает"""
+        if not self.nc or not self.nc.is_connected:
+            NATS_PUBLISH_ERRORS.labels("publish_raw").inc()
+            raise ConnectionError("NATS не подключен")
+        
+        started = time.perf_counter()
+        try:
+            await self.nc.publish(subject, payload, headers=headers)
+        except Exception:
+            NATS_PUBLISH_ERRORS.labels("publish_raw").inc()
+            raise
+        NATS_PUBLISH_DURATION.labels("publish_raw").observe(time.perf_counter() - started)
+    
+    async def subscribe(self, subject: str, callback: Callable, raw: bool = False) -> bool:
+        """callback получает разобранный JSON или, при raw=True, само сообщение NATS"""
         if not self.nc:
             logger.warning("NATS не подключен, лол")
-            return
+            return False
         
         async def message_handler(msg):
             try:
-                data = json.loads(msg.data.decode())
+                if raw:
+                    await callback(msg)
+                    return
+                data = loads(msg.data)
                 await callback(data)
-            except json.JSONDecodeError:
+            except ValueError:
                 logger.error(f"JSON инвалид: {msg.data}")
             except Exception as e:
                 logger.error(f"Ошибка управление ошибка: {e}")
@@ -58,29 +99,10 @@ class NATSService:
         try:
             await self.nc.subscribe(subject, cb=message_handler)
             logger.info(f"Подписан на {subject}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка подписки: {e}")
-    
-    async def publish_currency_created(self, currency_data: dict):
-        await self.publish("currency.created", {
-            "event": "currency_created",
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": currency_data
-        })
-    
-    async def publish_currency_updated(self, currency_data: dict):
-        await self.publish("currency.updated", {
-            "event": "currency_updated",
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": currency_data
-        })
-    
-    async def publish_currency_deleted(self, currency_id: int):
-        await self.publish("currency.deleted", {
-            "event": "currency_deleted",
-            "timestamp": datetime.utcnow().isoformat(),
-            "currency_id": currency_id
-        })
+            return False
     
     async def publish_task_completed(self, task_data: dict):
         await self.publish("task.completed", {
@@ -0,0 +1,23 @@
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+from typing import List
+
+from app.models.models_db import OutboxEvent
+from app.services.events import Event
+
+# Будит публикатор после коммита, чтобы не ждать очередного опроса
+outbox_signal = asyncio.Event()
+
+
+async def add_outbox_events(session: AsyncSession, events: List[Event]):
+    """Кладёт события в outbox текущей транзакции; коммитит вызывающий"""
+    if events:
+        await session.execute(
+            insert(OutboxEvent),
+            [{"subject": event.subject, "payload": event.text} for event in events]
+        )
+
+
+def notify_outbox():
+    outbox_signal.set()
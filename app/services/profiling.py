@@ -0,0 +1,218 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.app_config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+
+class Profile:
+    """Профиль одного запроса, WebSocket-сессии или цикла фоновой задачи.
+
+    duration - время выполнения для http и background; для websocket это время,
+    когда обработчик соединения реально занимал event loop (сессия живёт долго,
+    и её длительность ничего не говорит о медленности).
+    """
+
+    def __init__(self, kind: str, name: str, task: asyncio.Task):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.name = name
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    @property
+    def duration(self) -> float:
+        if self.kind == "websocket":
+            return self.samples * settings.PROFILING_INTERVAL
+        return self.wall
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "wall_ms": round(self.wall * 1000, 2),
+            "samples": self.samples
+        }
+
+    def collapsed(self) -> str:
+        """Формат flamegraph.pl / speedscope: "корень;...;лист количество" построчно"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def text(self, limit: int = 30) -> str:
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+
+        samples = self.samples or 1
+        lines = [
+            f"{self.kind} {self.name}",
+            f"начало {self.started_at.isoformat()}, длительность {self.duration * 1000:.1f} мс, "
+            f"wall {self.wall * 1000:.1f} мс, сэмплов {self.samples} по {settings.PROFILING_INTERVAL * 1000:.0f} мс",
+        ]
+        for title, counter in (("Собственное время", own), ("С вложенными вызовами", total)):
+            lines += ["", f"{title}:", f"{'сэмплов':>8} {'%':>6}  функция"]
+            for frame, count in counter.most_common(limit):
+                lines.append(f"{count:>8} {100 * count / samples:>5.1f}%  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик для asyncio.
+
+    Фоновый поток раз в PROFILING_INTERVAL смотрит, какая задача сейчас
+    выполняется в event loop; если она профилируется, снимает её стек.
+    Так в профиль попадает только время, когда сама задача занимала loop:
+    ожидание БД (поток aiosqlite), сети и чужие запросы не смешиваются.
+    Работа в дочерних задачах (asyncio.gather) не учитывается.
+
+    Поток спит, пока нет активных профилей; выключенный профилировщик
+    (PROFILING_ENABLED=False) не стоит ничего - middleware не подключается.
+    """
+
+    def __init__(self):
+        self._active: Dict[asyncio.Task, Tuple[Profile, asyncio.AbstractEventLoop]] = {}
+        self._kept: List[Profile] = []
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, kind: str, name: str) -> Profile:
+        task = asyncio.current_task()
+        profile = Profile(kind, name, task)
+        self._active[task] = (profile, asyncio.get_running_loop())
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+        return profile
+
+    def end(self, profile: Profile):
+        profile.wall = time.perf_counter() - profile.started
+        self._active.pop(profile.task, None)
+        profile.task = None
+        self._keep(profile)
+
+    def _keep(self, profile: Profile):
+        # Храним N самых медленных
+        self._kept.append(profile)
+        if len(self._kept) > settings.PROFILING_KEEP:
+            self._kept.remove(min(self._kept, key=lambda kept: kept.duration))
+
+    def profiles(self) -> List[Profile]:
+        return sorted(self._kept, key=lambda profile: profile.duration, reverse=True)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        for profile in self._kept:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def clear(self):
+        self._kept.clear()
+
+    def _sample_loop(self):
+        while True:
+            if not self._active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(settings.PROFILING_INTERVAL)
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"Ошибка профилировщика: {e}")
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for profile, loop in list(self._active.values()):
+            if asyncio.current_task(loop) is not profile.task:
+                continue
+            frame = frames.get(profile.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                profile.stacks[tuple(reversed(stack))] += 1
+                profile.samples += 1
+
+    @staticmethod
+    def authorized(token: Optional[str]) -> bool:
+        """Токен X-Profile совпадает с PROFILING_SECRET; без секрета доступа нет ни у кого"""
+        if not settings.PROFILING_SECRET or token is None:
+            return False
+        return hmac.compare_digest(token.encode(), settings.PROFILING_SECRET.encode())
+
+    def should_profile(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                return self.authorized(value.decode("latin-1"))
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": settings.PROFILING_ENABLED,
+            "active": len(self._active),
+            "kept": len(self._kept)
+        }
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilingMiddleware:
+    """Профилирует долю запросов (PROFILING_SAMPLE_RATE) и запросы с заголовком
+    X-Profile: <PROFILING_SECRET>. Id профиля возвращается в X-Profile-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.begin(scope["type"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                profile.name = f"{scope.get('method', 'WS')} {route.path}"
+            profiler.end(profile)
@@ -0,0 +1,197 @@
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.schemas import CurrencyResponse
+
+logger = logging.getLogger(__name__)
+
+PIVOT = "USD"
+
+
+class RateMatrix:
+    """Матрица кросс-курсов N x N поверх активных валютных пар.
+
+    M[i, j] - сколько единиц j дают за 1 единицу i. Прямые пары берутся как есть,
+    остальные выводятся через стоимость валюты в единицах опорной валюты
+    компоненты (обход в ширину по графу пар). Для пар без пути - NaN.
+    """
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        self.matrix = np.empty((0, 0))
+        self._edges: Dict[Tuple[int, int], float] = {}
+        self._adjacent: List[List[int]] = []
+        self._values = np.empty(0)
+        self._component = np.empty(0, dtype=np.int64)
+        self._parent: List[int] = []
+        self._children: List[int] = []
+        # пара -> (курс, номер записи); из встречных пар побеждает более поздняя
+        self._pairs: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._writes = 0
+        self._dirty = False
+
+    def reset(self, items: Iterable[CurrencyResponse]):
+        self._pairs = {}
+        # Порядок записей как в БД по времени: из встречных пар побеждает обновлённая последней,
+        # как и при пошаговых apply - иначе после перезагрузки снимка курс зависел бы от id
+        for item in sorted(items, key=lambda item: (item.last_updated, item.id)):
+            if item.is_active:
+                self._record(item)
+        self._dirty = True
+
+    def apply(self, previous: Optional[CurrencyResponse], item: CurrencyResponse):
+        pair = (item.base, item.target)
+        moved = previous is not None and (previous.base, previous.target) != pair
+
+        if moved or not item.is_active:
+            if previous is not None and previous.is_active:
+                self._pairs.pop((previous.base, previous.target), None)
+            if item.is_active:
+                self._record(item)
+            self._dirty = True
+            return
+
+        is_new = pair not in self._pairs
+        self._record(item)
+        if is_new or self._dirty:
+            self._dirty = True
+            return
+
+        self._update_edge(self.index[item.base], self.index[item.target], item.current_rate)
+
+    def _record(self, item: CurrencyResponse):
+        self._writes += 1
+        self._pairs[(item.base, item.target)] = (item.current_rate, self._writes)
+
+    def rate(self, source: str, target: str) -> Optional[float]:
+        self._ensure_built()
+        i = self.index.get(source.upper())
+        j = self.index.get(target.upper())
+        if i is None or j is None:
+            return None
+        value = self.matrix[i, j]
+        if np.isnan(value):
+            return None
+        return float(value)
+
+    def rates(self, sources: Sequence[str], targets: Sequence[str]) -> np.ndarray:
+        """Кросс-курсы для массивов кодов за один проход, неизвестные - NaN"""
+        self._ensure_built()
+        size = len(self.symbols)
+        # Последняя строка/столбец - заглушка из NaN для неизвестных валют
+        padded = np.full((size + 1, size + 1), np.nan)
+        padded[:size, :size] = self.matrix
+        return padded[self._lookup(sources), self._lookup(targets)]
+
+    def convert(self, sources: Sequence[str], targets: Sequence[str], amounts: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        rates = self.rates(sources, targets)
+        return rates, rates * np.asarray(amounts, dtype=np.float64)
+
+    def _lookup(self, codes: Sequence[str]) -> np.ndarray:
+        unknown = len(self.symbols)
+        unique, inverse = np.unique(np.asarray(codes, dtype=str), return_inverse=True)
+        mapped = np.array(
+            [self.index.get(code.upper(), unknown) for code in unique],
+            dtype=np.int64
+        )
+        return mapped[inverse]
+
+    def _ensure_built(self):
+        if self._dirty:
+            self._rebuild()
+
+    def _rebuild(self):
+        symbols = sorted({code for pair in self._pairs for code in pair})
+        index = {code: i for i, code in enumerate(symbols)}
+        size = len(symbols)
+
+        edges: Dict[Tuple[int, int], float] = {}
+        written: Dict[Tuple[int, int], int] = {}
+        adjacent: List[List[int]] = [[] for _ in range(size)]
+        for (base, target), (rate, seq) in self._pairs.items():
+            a, b = index[base], index[target]
+            if a == b:
+                continue
+            if (a, b) not in edges:
+                adjacent[a].append(b)
+                adjacent[b].append(a)
+            elif written[(a, b)] > seq:
+                continue
+            edges[(a, b)] = rate
+            edges[(b, a)] = 1 / rate
+            written[(a, b)] = written[(b, a)] = seq
+
+        values = np.full(size, np.nan)
+        component = np.full(size, -1, dtype=np.int64)
+        parent = [-1] * size
+        children = [0] * size
+
+        roots = ([index[PIVOT]] if PIVOT in index else []) + list(range(size))
+        for root in roots:
+            if component[root] != -1:
+                continue
+            component[root] = root
+            values[root] = 1.0
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for neighbour in adjacent[node]:
+                    if component[neighbour] != -1:
+                        continue
+                    component[neighbour] = root
+                    values[neighbour] = values[node] / edges[(node, neighbour)]
+                    parent[neighbour] = node
+                    children[node] += 1
+                    queue.append(neighbour)
+
+        self.symbols = symbols
+        self.index = index
+        self._edges = edges
+        self._adjacent = adjacent
+        self._values = values
+        self._component = component
+        self._parent = parent
+        self._children = children
+
+        matrix = np.outer(values, 1 / values) if size else np.empty((0, 0))
+        matrix[component[:, None] != component[None, :]] = np.nan
+        for (a, b), rate in edges.items():
+            matrix[a, b] = rate
+        self.matrix = matrix
+        self._dirty = False
+        logger.debug(f"Матрица курсов перестроена: {size} валют")
+
+    def _update_edge(self, a: int, b: int, rate: float):
+        if a == b:
+            return
+        self._edges[(a, b)] = rate
+        self._edges[(b, a)] = 1 / rate
+
+        # Лист дерева обхода: меняется только его стоимость, правим строку и столбец
+        if self._parent[b] == a and self._children[b] == 0:
+            self._values[b] = self._values[a] / rate
+            self._patch(b)
+        elif self._parent[a] == b and self._children[a] == 0:
+            self._values[a] = self._values[b] * rate
+            self._patch(a)
+        elif self._parent[a] == b or self._parent[b] == a:
+            # Ребро дерева с поддеревом - дешевле пересчитать целиком
+            self._dirty = True
+        else:
+            self.matrix[a, b] = rate
+            self.matrix[b, a] = 1 / rate
+
+    def _patch(self, node: int):
+        values = self._values
+        other = self._component != self._component[node]
+        self.matrix[node, :] = values[node] / values
+        self.matrix[:, node] = values / values[node]
+        self.matrix[node, other] = np.nan
+        self.matrix[other, node] = np.nan
+        for neighbour in self._adjacent[node]:
+            self.matrix[node, neighbour] = self._edges[(node, neighbour)]
+            self.matrix[neighbour, node] = self._edges[(neighbour, node)]
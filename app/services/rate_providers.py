@@ -0,0 +1,263 @@
+import asyncio
+import httpx
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.app_config import settings
+from app.services.metrics import UPSTREAM_PROVIDER_DURATION
+from app.services.stub_rates import stub_app
+from app.services.upstream_client import UpstreamClient, upstream_client
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    def __init__(self, window: int = 200):
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.wins = 0
+        self.last_error: Optional[str] = None
+        self.latencies: deque = deque(maxlen=window)
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+
+    def record_error(self, latency: float, error: Exception):
+        self.requests += 1
+        self.errors += 1
+        self.last_error = str(error)
+        self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "wins": self.wins,
+            "last_error": self.last_error,
+            "latency_p50": self.percentile(0.5),
+            "latency_p95": self.percentile(0.95)
+        }
+
+
+class RateProvider:
+    """Источник курсов: fetch возвращает {target: rate} или None, если данные не изменились"""
+
+    name = "base"
+
+    def __init__(self):
+        self.stats = ProviderStats()
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def reset_validators(self):
+        pass
+
+    async def fetch(self, base: str, targets: List[str]) -> Optional[Dict[str, float]]:
+        raise NotImplementedError
+
+
+class FrankfurterProvider(RateProvider):
+    name = "frankfurter"
+
+    def __init__(self, url: str, client: UpstreamClient):
+        super().__init__()
+        self.url = url
+        self.client = client
+
+    def reset_validators(self):
+        self.client.reset_validators()
+
+    async def fetch(self, base: str, targets: List[str]) -> Optional[Dict[str, float]]:
+        data = await self.client.get_json_if_changed(self.url, params={
+            "from": base,
+            "to": ",".join(targets)
+        })
+        if data is None:
+            return None
+        return data.get("rates", {})
+
+
+class ErApiProvider(RateProvider):
+    """open.er-api.com: отдаёт все цели для базы, лишние отбрасываем"""
+
+    name = "erapi"
+
+    def __init__(self, url: str, client: UpstreamClient):
+        super().__init__()
+        self.url = url.rstrip("/")
+        self.client = client
+
+    def reset_validators(self):
+        self.client.reset_validators()
+
+    async def fetch(self, base: str, targets: List[str]) -> Optional[Dict[str, float]]:
+        data = await self.client.get_json_if_changed(f"{self.url}/{base}")
+        if data is None:
+            return None
+        if data.get("result") not in (None, "success"):
+            raise RuntimeError(f"erapi: {data.get('error-type', data.get('result'))}")
+        rates = data.get("rates", {})
+        return {target: rates[target] for target in targets if target in rates}
+
+
+class StubProvider(FrankfurterProvider):
+    """Встроенный источник: ASGI-приложение stub_rates в том же процессе, без сети"""
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__(
+            "http://stub/latest",
+            UpstreamClient(transport=httpx.ASGITransport(app=stub_app))
+        )
+
+    async def start(self):
+        await self.client.start()
+
+    async def close(self):
+        await self.client.close()
+
+
+PROVIDERS = {
+    "frankfurter": lambda: FrankfurterProvider(settings.EXCHANGE_API_URL, upstream_client),
+    "erapi": lambda: ErApiProvider(settings.ERAPI_URL, upstream_client),
+    "stub": StubProvider,
+}
+
+
+class HedgedRateFetcher:
+    """Опрашивает провайдеров по порядку с хеджированием.
+
+    Следующий провайдер запускается, если текущие не ответили за hedge_delay,
+    или сразу, если все запущенные упали. Побеждает первый успешный ответ.
+    """
+
+    def __init__(self, providers: List[RateProvider], hedge_delay: float):
+        if not providers:
+            raise ValueError("Не задан ни один провайдер курсов")
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+
+    async def start(self):
+        for provider in self.providers:
+            await provider.start()
+
+    async def close(self):
+        for provider in self.providers:
+            await provider.close()
+
+    def reset_validators(self):
+        for provider in self.providers:
+            provider.reset_validators()
+
+    async def fetch(self, base: str, targets: List[str]) -> Optional[Dict[str, float]]:
+        queue = iter(self.providers)
+        running: Dict[asyncio.Task, RateProvider] = {}
+        errors: List[Exception] = []
+
+        def launch() -> bool:
+            provider = next(queue, None)
+            if provider is None:
+                return False
+            task = asyncio.create_task(self._call(provider, base, targets))
+            running[task] = provider
+            return True
+
+        launch()
+        exhausted = False
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=None if exhausted else self.hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if launch():
+                        logger.info(f"Хедж-запрос {base}: {list(running.values())[-1].name}")
+                    else:
+                        exhausted = True
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        provider.stats.wins += 1
+                        return task.result()
+                    errors.append(error)
+
+                if not running and not launch():
+                    break
+        finally:
+            for task, provider in running.items():
+                task.cancel()
+                provider.stats.cancelled += 1
+
+        raise errors[-1]
+
+    async def _call(self, provider: RateProvider, base: str, targets: List[str]):
+        started = time.perf_counter()
+        try:
+            result = await provider.fetch(base, targets)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            latency = time.perf_counter() - started
+            provider.stats.record_error(latency, e)
+            UPSTREAM_PROVIDER_DURATION.labels(provider.name, "error").observe(latency)
+            logger.warning(f"Провайдер {provider.name} не ответил для {base}: {e}")
+            raise
+        latency = time.perf_counter() - started
+        provider.stats.record_success(latency)
+        UPSTREAM_PROVIDER_DURATION.labels(provider.name, "unchanged" if result is None else "ok").observe(latency)
+        return result
+
+    def get_stats(self) -> List[dict]:
+        return [
+            {"provider": provider.name, **provider.stats.to_dict()}
+            for provider in self.providers
+        ]
+
+
+rate_fetcher: Optional[HedgedRateFetcher] = None
+
+
+async def init_rate_providers():
+    global rate_fetcher
+    providers = []
+    for name in settings.rate_providers:
+        factory = PROVIDERS.get(name)
+        if factory is None:
+            logger.error(f"Неизвестный провайдер курсов: {name}")
+            continue
+        providers.append(factory())
+    rate_fetcher = HedgedRateFetcher(providers, settings.RATE_HEDGE_DELAY)
+    await rate_fetcher.start()
+    logger.info(f"Провайдеры курсов: {[provider.name for provider in providers]}")
+
+
+async def close_rate_providers():
+    if rate_fetcher:
+        await rate_fetcher.close()
+
+
+def get_rate_fetcher() -> HedgedRateFetcher:
+    if not rate_fetcher:
+        raise RuntimeError("Провайдеры курсов не инициализированы")
+    return rate_fetcher
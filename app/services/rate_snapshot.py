@@ -0,0 +1,175 @@
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from app.models.models_db import Currency
+from app.models.schemas import CurrencyResponse
+
+logger = logging.getLogger(__name__)
+
+# Сериализатор pydantic-core: кодирует список моделей без промежуточных dict'ов
+_LIST_ADAPTER = TypeAdapter(List[CurrencyResponse])
+
+
+class RateSnapshot:
+    """Снимок валютных пар в памяти процесса.
+
+    Все методы синхронные: в рамках event loop изменение индексов
+    происходит атомарно между await'ами.
+
+    data_version - версия данных в БД, которой соответствует снимок. Запись
+    этого процесса сдвигает её сама; если версия в БД ушла дальше (писал
+    другой процесс), снимок перечитывается, см. CurrencyService.load_snapshot.
+    ETag и modified_at выводятся из данных БД, поэтому совпадают у всех воркеров
+    и не меняются от перезагрузки снимка. version - внутренний счётчик изменений
+    самого снимка, по нему сбрасываются кэши.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.version = 0
+        self.modified_at: Optional[datetime] = None
+        self.data_version: Optional[int] = None
+        self.data_epoch: Optional[str] = None
+        self._checked_at = 0.0
+        self._by_id: Dict[int, CurrencyResponse] = {}
+        self._by_pair: Dict[Tuple[str, str], int] = {}
+        self._item_bodies: Dict[int, bytes] = {}
+        self._list_body: Optional[bytes] = None
+        self._listeners: List = []
+
+    def add_listener(self, listener):
+        """listener.reset(items) при загрузке и listener.apply(previous, item) при записи"""
+        self._listeners.append(listener)
+
+    def load(
+        self,
+        currencies: Iterable[Currency],
+        data_version: Optional[int] = None,
+        data_epoch: Optional[str] = None
+    ):
+        self._by_id.clear()
+        self._by_pair.clear()
+        self._item_bodies.clear()
+        self._list_body = None
+        self.modified_at = None
+        for currency in currencies:
+            self._put(currency, notify=False)
+        for listener in self._listeners:
+            listener.reset(self._by_id.values())
+        self.data_version = data_version
+        self.data_epoch = data_epoch
+        self._checked_at = time.monotonic()
+        self.loaded = True
+        self._bump()
+        logger.info(f"Снимок курсов загружен: {len(self._by_id)} пар")
+
+    def put(self, currency: Currency, data_version: Optional[int] = None):
+        self.put_many([currency], data_version)
+
+    def put_many(self, currencies: Iterable[Currency], data_version: Optional[int] = None):
+        """Запись этого процесса; data_version - версия данных после её транзакции"""
+        self._bump()
+        if not self.loaded:
+            return
+        for currency in currencies:
+            self._put(currency)
+        self._list_body = None
+        if data_version is not None:
+            self._advance(data_version)
+
+    def apply_remote(self, items: Iterable, data_version: Optional[int]):
+        """Запись другого процесса (рассылка между воркерами).
+
+        Применяется, только если продолжает снимок без пропуска: иначе старое событие
+        могло бы затереть более новую запись. Уже учтённые версии пропускаются,
+        при пропуске снимок перечитывается при следующем чтении.
+        """
+        if not self.loaded:
+            return
+        if data_version is not None and self.data_version is not None and data_version <= self.data_version:
+            return
+        if data_version is None or self.data_version is None or data_version != self.data_version + 1:
+            self.invalidate()
+            return
+        for item in items:
+            self._put(item)
+        self._list_body = None
+        self.data_version = data_version
+        self._bump()
+
+    def _advance(self, data_version: int):
+        if self.data_version is not None and data_version == self.data_version + 1:
+            self.data_version = data_version
+        elif self.data_version is None or data_version > self.data_version:
+            # Между загрузкой и этой записью писал другой процесс, а его изменений в снимке нет
+            self.invalidate()
+
+    def invalidate(self):
+        self.loaded = False
+        self._bump()
+
+    def check_due(self, interval: float) -> bool:
+        """Пора ли сверить data_version с БД; отметка ставится сразу, чтобы сверял один запрос"""
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return False
+        self._checked_at = now
+        return True
+
+    @property
+    def etag(self) -> Optional[str]:
+        if self.data_version is None:
+            return None
+        return f'"{self.data_epoch}-{self.data_version}"'
+
+    def _bump(self):
+        self.version += 1
+
+    def _put(self, currency: Currency, notify: bool = True):
+        item = CurrencyResponse.model_validate(currency)
+
+        previous = self._by_id.get(item.id)
+        if previous and self._by_pair.get((previous.base, previous.target)) == item.id:
+            del self._by_pair[(previous.base, previous.target)]
+
+        self._by_id[item.id] = item
+        if self.modified_at is None or item.last_updated > self.modified_at:
+            self.modified_at = item.last_updated
+        self._item_bodies.pop(item.id, None)
+        if item.is_active:
+            self._by_pair[(item.base, item.target)] = item.id
+
+        if notify:
+            for listener in self._listeners:
+                listener.apply(previous, item)
+
+    def get(self, currency_id: int) -> Optional[CurrencyResponse]:
+        return self._by_id.get(currency_id)
+
+    def get_pair(self, base: str, target: str) -> Optional[CurrencyResponse]:
+        currency_id = self._by_pair.get((base.upper(), target.upper()))
+        if currency_id is None:
+            return None
+        return self._by_id.get(currency_id)
+
+    def active(self) -> List[CurrencyResponse]:
+        return [item for item in self._by_id.values() if item.is_active]
+
+    def item_body(self, currency_id: int) -> Optional[bytes]:
+        body = self._item_bodies.get(currency_id)
+        if body is None:
+            item = self._by_id.get(currency_id)
+            if item is None:
+                return None
+            body = item.model_dump_json().encode()
+            self._item_bodies[currency_id] = body
+        return body
+
+    def list_body(self) -> bytes:
+        if self._list_body is None:
+            self._list_body = _LIST_ADAPTER.dump_json(self.active())
+        return self._list_body
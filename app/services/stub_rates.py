@@ -0,0 +1,69 @@
+import asyncio
+import random
+import time
+import zlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse
+
+from app.app_config import settings
+
+# Примерные стоимости в USD, остальные коды получают стабильное значение из хэша
+_KNOWN_VALUES = {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "JPY": 0.0067, "CNY": 0.14,
+    "INR": 0.012, "CAD": 0.74, "AUD": 0.66, "CZK": 0.044, "EGP": 0.021,
+    "RUB": 0.011, "CHF": 1.13,
+}
+
+stub_app = FastAPI(
+    title="Stub rates provider",
+    description="Локальный Frankfurter-совместимый источник курсов для тестов и бенчмарков"
+)
+
+
+def _usd_value(code: str, tick: int) -> float:
+    seed = zlib.crc32(code.encode())
+    value = _KNOWN_VALUES.get(code)
+    if value is None:
+        value = 0.01 + (seed % 10000) / 100
+    # Небольшое детерминированное колебание, меняется раз в STUB_TICK секунд
+    return value * (1 + 0.002 * ((seed + tick * 7919) % 200 - 100) / 100)
+
+
+@stub_app.get("/latest")
+async def latest(
+    request: Request,
+    base: str = Query("USD", alias="from"),
+    to: Optional[str] = None
+):
+    if settings.STUB_LATENCY > 0:
+        await asyncio.sleep(settings.STUB_LATENCY)
+    if settings.STUB_ERROR_RATE > 0 and random.random() < settings.STUB_ERROR_RATE:
+        return Response(status_code=503)
+
+    base = base.upper()
+    targets = [code.strip().upper() for code in to.split(",")] if to else list(_KNOWN_VALUES)
+    tick = int(time.time() / settings.STUB_TICK)
+
+    etag = f'"{zlib.crc32(f"{base}:{to}".encode())}-{tick}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    base_value = _usd_value(base, tick)
+    rates = {
+        target: round(base_value / _usd_value(target, tick), 6)
+        for target in targets
+        if target and target != base
+    }
+
+    return JSONResponse(
+        {
+            "amount": 1.0,
+            "base": base,
+            "date": datetime.utcnow().date().isoformat(),
+            "rates": rates
+        },
+        headers={"ETag": etag}
+    )
@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import httpx
+import logging
+from typing import Dict, Optional
+
+from app.app_config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Равномерно разносит запросы: не чаще rate в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class UpstreamClient:
+    """Долгоживущий HTTP-клиент к внешним API курсов.
+
+    Держит пул keep-alive соединений и валидаторы ответов (ETag, Last-Modified,
+    хэш тела) для условных запросов: неизменившиеся данные возвращаются как None.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self.client: Optional[httpx.AsyncClient] = None
+        self._validators: Dict[str, dict] = {}
+        self._semaphore = asyncio.Semaphore(settings.UPSTREAM_CONCURRENCY)
+        self._limiter = RateLimiter(settings.UPSTREAM_RATE_LIMIT)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            transport=self.transport,
+            timeout=httpx.Timeout(
+                settings.UPSTREAM_READ_TIMEOUT,
+                connect=settings.UPSTREAM_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+            )
+        )
+        logger.info("HTTP-клиент внешних API запущен")
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+            logger.info("HTTP-клиент внешних API закрыт")
+
+    async def get_json_if_changed(self, url: str, params: Optional[dict] = None) -> Optional[dict]:
+        if not self.client:
+            raise RuntimeError("HTTP-клиент не инициализирован")
+
+        key = str(httpx.URL(url, params=params))
+        validators = self._validators.get(key, {})
+
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        async with self._semaphore:
+            await self._limiter.acquire()
+            response = await self.client.get(url, params=params, headers=headers)
+        logger.info(f"Статус ответа: {response.status_code}")
+
+        if response.status_code == 304:
+            logger.info("Данные не изменились (304)")
+            return None
+
+        response.raise_for_status()
+
+        # Не все API умеют в ETag - сравниваем тело, чтобы не парсить его зря
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        unchanged = digest == validators.get("digest")
+
+        self._validators[key] = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "digest": digest
+        }
+
+        if unchanged:
+            logger.info("Данные не изменились (тело совпадает)")
+            return None
+
+        return response.json()
+
+    def reset_validators(self):
+        self._validators.clear()
+
+
+upstream_client = UpstreamClient()
+
+
+async def init_upstream_client():
+    await upstream_client.start()
+
+
+async def close_upstream_client():
+    await upstream_client.close()
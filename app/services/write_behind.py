@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from app.app_config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.models_db import Currency
+from app.models.schemas import CurrencyUpdate
+from app.services.currency_service import CurrencyService
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindError(RuntimeError):
+    """Пачка, в которую попало изменение, не закоммичена"""
+
+
+class RateWriteQueue:
+    """Отложенная запись изменений пар (write-behind).
+
+    Изменения копятся в течение WRITE_BEHIND_WINDOW, изменения одной пары
+    сливаются (побеждает последнее), затем единственная задача-писатель
+    коммитит пачку одной транзакцией. Вызывающий ждёт коммита своей пачки.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, CurrencyUpdate] = {}
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.submitted = 0
+        self.committed = 0
+        self.batches = 0
+
+    async def start(self):
+        if self._task and not self._task.done():
+            logger.warning("Очередь отложенной записи уже запущена")
+            return
+        self._closing = False
+        self._task = asyncio.create_task(self._writer())
+        logger.info("Очередь отложенной записи запущена")
+
+    async def stop(self):
+        if not self._task:
+            return
+        # Не отменяем писателя посреди коммита: он допишет принятое и выйдет сам
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info("Очередь отложенной записи остановлена")
+
+    def submit(self, currency_id: int, currency: CurrencyUpdate) -> asyncio.Future:
+        """Ставит изменение в очередь.
+
+        future завершится валютой после коммита, None для несуществующей пары
+        или WriteBehindError, если пачку не удалось записать.
+        """
+        if not self._task or self._closing:
+            raise RuntimeError("Очередь отложенной записи не запущена")
+
+        previous = self._pending.get(currency_id)
+        if previous is not None:
+            currency = previous.model_copy(update=currency.model_dump(exclude_none=True))
+        self._pending[currency_id] = currency
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(currency_id, []).append(future)
+        self.submitted += 1
+
+        if len(self._pending) >= settings.WRITE_BEHIND_MAX_BATCH:
+            self._wakeup.set()
+        elif len(self._pending) == 1 and previous is None:
+            # Первое изменение открывает окно слияния
+            self._wakeup.set()
+        return future
+
+    async def update(self, currency_id: int, currency: CurrencyUpdate) -> Optional[Currency]:
+        return await self.submit(currency_id, currency)
+
+    async def _writer(self):
+        while not (self._closing and not self._pending):
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            # Окно слияния: повторные изменения тех же пар за это время схлопнутся
+            if len(self._pending) < settings.WRITE_BEHIND_MAX_BATCH and not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.WRITE_BEHIND_WINDOW)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            await self._flush()
+            if self._pending:
+                self._wakeup.set()
+
+    async def _flush(self):
+        batch, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, {}
+
+        results: Optional[Dict[int, Currency]] = None
+        try:
+            async with AsyncSessionLocal() as session:
+                results = await CurrencyService.update_many(session, batch)
+        except Exception as e:
+            logger.error(f"Ошибка отложенной записи: {e}")
+
+        if results is not None:
+            self.committed += len(results)
+            self.batches += 1
+        for currency_id, futures in waiters.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if results is None:
+                    future.set_exception(WriteBehindError("Пачка отложенной записи не закоммичена"))
+                else:
+                    future.set_result(results.get(currency_id))
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "committed": self.committed,
+            "batches": self.batches
+        }
+
+
+write_queue = RateWriteQueue()
+
+
+async def start_write_behind():
+    if settings.WRITE_BEHIND:
+        await write_queue.start()
+
+
+async def stop_write_behind():
+    await write_queue.stop()
+
+
+def get_write_queue() -> RateWriteQueue:
+    return write_queue
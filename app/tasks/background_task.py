@@ -1,22 +1,21 @@
 import asyncio
 import httpx
 import logging
-from datetime import datetime
-from typing import Optional
-from sqlalchemy.ext.asyncio import AsyncSession
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 from app.db.database import AsyncSessionLocal
 from app.services.currency_service import CurrencyService
-from app.models.models_db import Currency
-from app.models.schemas import CurrencyCreate
+from app.services.metrics import BACKGROUND_CYCLE_DURATION, UPSTREAM_FETCH_DURATION
 from app.services.nats_service import get_nats_service
-from app.ws.ws_manager import manager
+from app.services.profiling import profiler
+from app.services.rate_providers import get_rate_fetcher
+from app.tasks.leader import get_leader
 from app.app_config import settings
 
 logger = logging.getLogger(__name__)
 
-target_currencies = ["EUR", "GBP", "JPY", "CNY", "INR", "CAD", "AUD", "CZK", "EGP", "RUB"]
-
 class TaskStatus:    
     def __init__(self):
         self.status = "pending"
@@ -29,33 +28,68 @@ class TaskStatus:
 task_status = TaskStatus()
 background_task: Optional[asyncio.Task] = None
 force_run_event = asyncio.Event()
+get_leader().on_run_requested(force_run_event.set)
+
+
+async def fetch_base_rates(base: str, targets: List[str]) -> Optional[Dict[str, float]]:
+    """Курсы base -> targets или None, если с прошлого запроса ничего не изменилось"""
+    logger.info(f"Запрос курсов: {base} -> {','.join(targets)}")
+    started = time.perf_counter()
+    try:
+        rates = await get_rate_fetcher().fetch(base, targets)
+    except Exception:
+        UPSTREAM_FETCH_DURATION.labels(base, "error").observe(time.perf_counter() - started)
+        raise
+    UPSTREAM_FETCH_DURATION.labels(base, "unchanged" if rates is None else "changed").observe(
+        time.perf_counter() - started
+    )
+    
+    if rates is not None:
+        logger.debug(f"Курсы {base}: {rates}")
+    return rates
+
 
+async def fetch_exchange_rates() -> Tuple[Optional[Dict[Tuple[str, str], float]], Dict[str, str]]:
+    """Курсы по всей вселенной {(base, target): rate} и ошибки по базам {base: ошибка}.
 
-async def fetch_exchange_rates() -> dict:
+    Курсы None, если ни одна из полученных баз не изменилась.
+    """
     try:
-        currencies_str = ",".join(target_currencies)
+        targets = settings.rate_targets
+        bases = settings.rate_bases
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            url = f"https://api.frankfurter.app/latest"
-            params = {
-                "from": "USD",
-                "to": currencies_str
-            }
-            
-            logger.info(f"Запрос курсов: USD -> {currencies_str}")
-            response = await client.get(url, params=params)
-            
-            logger.info(f"Статус ответа: {response.status_code}")
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            rates = data.get("rates", {})
-            
-            logger.info(f"Получено {len(rates)} курсов валют")
-            logger.debug(f"Курсы: {rates}")
-            
-            return rates
+        # Параллелизм и темп запросов ограничивают upstream-клиенты провайдеров
+        results = await asyncio.gather(
+            *(
+                fetch_base_rates(base, [target for target in targets if target != base])
+                for base in bases
+            ),
+            return_exceptions=True
+        )
+        
+        rates: Dict[Tuple[str, str], float] = {}
+        errors: Dict[str, BaseException] = {}
+        changed = False
+        for base, result in zip(bases, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Не удалось получить курсы {base}: {result}")
+                errors[base] = result
+                continue
+            if result is None:
+                continue
+            changed = True
+            for target, rate in result.items():
+                rates[(base, target.upper())] = rate
+        
+        if errors and len(errors) == len(bases):
+            raise next(iter(errors.values()))
+        
+        failed = {base: str(error) for base, error in errors.items()}
+        if not changed:
+            return None, failed
+        
+        logger.info(f"Получено {len(rates)} курсов валют")
+        return rates, failed
     except httpx.RequestError as e:
         logger.error(f"HTTP request error: {e}")
         raise
@@ -64,96 +98,36 @@ async def fetch_exchange_rates() -> dict:
         raise
 
 
-async def update_currencies_in_db(rates: dict):
+async def update_currencies_in_db(rates: Dict[Tuple[str, str], float]):
     async with AsyncSessionLocal() as session:
         try:
-            for target in target_currencies:
-                if target not in rates:
-                    continue
-                
-                rate = rates[target]
-                
-                existing = await CurrencyService.get_by_pair(
-                    session, "USD", target
-                )
-                
-                if existing:
-                    if existing.current_rate != rate:
-                        existing.current_rate = rate
-                        await session.commit()
-                        await session.refresh(existing)
-                        
-                        try:
-                            nats = get_nats_service()
-                            await nats.publish_currency_updated({
-                                "id": existing.id,
-                                "base": existing.base,
-                                "target": existing.target,
-                                "current_rate": existing.current_rate,
-                                "last_updated": existing.last_updated.isoformat()
-                            })
-                        except Exception as e:
-                            logger.error(f"Failed to publish NATS event: {e}")
-                        
-                        await manager.broadcast({
-                            "event_type": "updated",
-                            "data": {
-                                "id": existing.id,
-                                "base": existing.base,
-                                "target": existing.target,
-                                "current_rate": existing.current_rate,
-                                "last_updated": existing.last_updated.isoformat()
-                            },
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
-                else:
-                    new_currency = await CurrencyService.create(
-                        session,
-                        CurrencyCreate(
-                            base="USD",
-                            target=target,
-                            current_rate=rate
-                        )
-                    )
-                    
-                    if new_currency:
-                        try:
-                            nats = get_nats_service()
-                            await nats.publish_currency_created({
-                                "id": new_currency.id,
-                                "base": new_currency.base,
-                                "target": new_currency.target,
-                                "current_rate": new_currency.current_rate,
-                                "last_updated": new_currency.last_updated.isoformat()
-                            })
-                        except Exception as e:
-                            logger.error(f"Failed to publish NATS event: {e}")
-                        
-                        await manager.broadcast({
-                            "event_type": "created",
-                            "data": {
-                                "id": new_currency.id,
-                                "base": new_currency.base,
-                                "target": new_currency.target,
-                                "current_rate": new_currency.current_rate,
-                                "last_updated": new_currency.last_updated.isoformat()
-                            },
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
-            
+            result = await CurrencyService.bulk_upsert_rates(session, rates)
+            if result is None:
+                raise RuntimeError("Не удалось сохранить курсы в БД")
+            created, updated = result
             logger.info("Database updated successfully")
         
         except Exception as e:
             logger.error(f"Error updating currencies: {e}")
             task_status.last_error = str(e)
             raise
+    
+    # Outbox и WS получают события из CurrencyService через event_bus
+    logger.info(f"Курсы: создано {len(created)}, обновлено {len(updated)}")
+
+
+def _cycle_finished(started: float, result: str):
+    BACKGROUND_CYCLE_DURATION.labels(result).observe(time.perf_counter() - started)
 
 
 async def background_task_worker():
     logger.info("Фоновая задача запускается")
     
     while True:
+        started = None
+        profile = None
         try:
+            task_status.next_run = datetime.utcnow() + timedelta(seconds=settings.BACKGROUND_TASK_INTERVAL)
             try:
                 await asyncio.wait_for(
                     force_run_event.wait(),
@@ -164,18 +138,50 @@ async def background_task_worker():
             except asyncio.TimeoutError:
                 pass
             
+            if not get_leader().is_leader:
+                # Курсы лидера попадают в снимок этого процесса через рассылку событий или сверку версии данных
+                task_status.status = "standby"
+                continue
+            
+            if settings.PROFILING_ENABLED and settings.PROFILING_BACKGROUND:
+                profile = profiler.begin("background", "update_cycle")
+            
             task_status.status = "running"
+            task_status.next_run = None
             task_status.last_run = datetime.utcnow()
+            started = time.perf_counter()
             task_status.total_runs += 1
             
             logger.info(f"Фоновая задача: (#{task_status.total_runs})")
             
-            rates = await fetch_exchange_rates()
+            rates, errors = await fetch_exchange_rates()
+            # Часть баз не получена: цикл не считается успешным, даже если остальные записаны
+            last_error = "; ".join(f"{base}: {error}" for base, error in errors.items()) or None
             
-            await update_currencies_in_db(rates)
+            if rates is None:
+                task_status.status = "partial" if errors else "completed"
+                task_status.last_error = last_error
+                logger.info("Курсы не изменились, обновление пропущено")
+                _cycle_finished(started, "partial" if errors else "unchanged")
+                continue
+            
+            if not get_leader().is_leader:
+                # Лидерство ушло, пока ждали провайдеров: курсы запишет новый лидер
+                task_status.status = "standby"
+                logger.warning("Лидерство потеряно во время обновления, запись пропущена")
+                _cycle_finished(started, "lost_leadership")
+                continue
+            
+            try:
+                await update_currencies_in_db(rates)
+            except Exception:
+                # Иначе следующий запрос получит 304 и изменения так и не попадут в БД
+                get_rate_fetcher().reset_validators()
+                raise
             
-            task_status.status = "completed"
-            task_status.last_error = None
+            task_status.status = "partial" if errors else "completed"
+            task_status.last_error = last_error
+            _cycle_finished(started, "partial" if errors else "updated")
             
             try:
                 nats = get_nats_service()
@@ -196,6 +202,11 @@ async def background_task_worker():
             logger.error(f"Ошибка выполнения ФЗ: {e}")
             task_status.status = "failed"
             task_status.last_error = str(e)
+            if started is not None:
+                _cycle_finished(started, "failed")
+        finally:
+            if profile is not None:
+                profiler.end(profile)
 
 
 async def start_background_task():
@@ -221,8 +232,13 @@ async def stop_background_task():
         logger.info("ФЗ остановлена")
 
 
-async def trigger_manual_run():
-    force_run_event.set()
+async def trigger_manual_run() -> Optional[str]:
+    """Запускает задачу на лидере: здесь же или через флаг в аренде; возвращает id лидера"""
+    leader = get_leader()
+    if leader.is_leader:
+        force_run_event.set()
+        return leader.instance_id
+    return await leader.request_run()
 
 
 def get_task_status() -> dict:
@@ -231,5 +247,6 @@ def get_task_status() -> dict:
         "last_run": task_status.last_run.isoformat() if task_status.last_run else None,
         "next_run": task_status.next_run.isoformat() if task_status.next_run else None,
         "total_runs": task_status.total_runs,
-        "last_error": task_status.last_error
+        "last_error": task_status.last_error,
+        "leader": get_leader().get_status()
     }
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import AsyncSessionLocal
+from app.models.models_db import LeaderLease
+from app.app_config import settings
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "background"
+
+
+class LeaderElector:
+    """Выбор лидера через строку аренды в БД.
+
+    Каждый процесс раз в LEADER_HEARTBEAT пытается продлить аренду на LEADER_LEASE_TTL:
+    удаётся держателю или любому, если аренда просрочена. Лидер, не сумевший
+    продлить аренду до её истечения, сам слагает полномочия, поэтому двух лидеров
+    одновременно не бывает при синхронизированных часах.
+    """
+
+    def __init__(self, name: str = LEASE_NAME):
+        self.name = name
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._holder = False
+        self.leader_id: Optional[str] = None
+        self.lease_expires_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._on_run_requested: List[Callable[[], None]] = []
+
+    @property
+    def is_leader(self) -> bool:
+        # Не смогли вовремя продлить аренду - уступаем, даже если продление ещё висит
+        return (
+            self._holder and
+            self.lease_expires_at is not None and
+            datetime.utcnow() < self.lease_expires_at
+        )
+
+    def on_run_requested(self, callback: Callable[[], None]):
+        self._on_run_requested.append(callback)
+
+    async def heartbeat(self):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.LEADER_LEASE_TTL)
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where(
+                    (LeaderLease.holder == self.instance_id) |
+                    (LeaderLease.expires_at < now)
+                )
+                .values(holder=self.instance_id, heartbeat_at=now, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                lease = await session.get(LeaderLease, self.name)
+                if lease is None:
+                    session.add(LeaderLease(
+                        name=self.name,
+                        holder=self.instance_id,
+                        heartbeat_at=now,
+                        expires_at=expires_at
+                    ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Первую аренду одновременно создал другой процесс
+                await session.rollback()
+
+            lease = await session.get(LeaderLease, self.name, populate_existing=True)
+            run_requested = False
+            if lease and lease.holder == self.instance_id and lease.run_requested:
+                lease.run_requested = False
+                await session.commit()
+                run_requested = True
+
+        was_leader = self.is_leader
+        self._holder = bool(lease and lease.holder == self.instance_id)
+        self.leader_id = lease.holder if lease else None
+        self.lease_expires_at = lease.expires_at if lease else None
+        self.last_error = None
+
+        if self.is_leader and not was_leader:
+            logger.info(f"Процесс {self.instance_id} стал лидером")
+        elif was_leader and not self.is_leader:
+            logger.warning(f"Процесс {self.instance_id} потерял лидерство, лидер: {self.leader_id}")
+
+        if run_requested:
+            logger.info("Получен пересланный запрос на запуск фоновой задачи")
+            for callback in self._on_run_requested:
+                callback()
+
+    async def release(self):
+        if not self._holder:
+            return
+        self._holder = False
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where(LeaderLease.holder == self.instance_id)
+                .values(expires_at=datetime.utcnow())
+            )
+            await session.commit()
+        logger.info("Аренда лидера освобождена")
+
+    async def request_run(self) -> Optional[str]:
+        """Просит действующего лидера запустить задачу; возвращает его id или None"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where(LeaderLease.expires_at >= datetime.utcnow())
+                .values(run_requested=True)
+            )
+            await session.commit()
+            if result.rowcount == 0:
+                return None
+            lease = await session.get(LeaderLease, self.name)
+            return lease.holder if lease else None
+
+    def get_status(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "is_leader": self.is_leader,
+            "leader_id": self.leader_id,
+            "lease_expires_at": self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            "last_error": self.last_error
+        }
+
+
+leader = LeaderElector()
+leader_task: Optional[asyncio.Task] = None
+
+
+async def leader_election_worker():
+    while True:
+        try:
+            await leader.heartbeat()
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            leader.last_error = str(e)
+            logger.error(f"Ошибка продления аренды лидера: {e}")
+
+        try:
+            await asyncio.sleep(settings.LEADER_HEARTBEAT)
+        except asyncio.CancelledError:
+            break
+
+
+async def start_leader_election():
+    global leader_task
+
+    if leader_task and not leader_task.done():
+        logger.warning("Выбор лидера уже запущен")
+        return
+
+    # Первая попытка синхронно: к старту фоновых задач роль уже известна
+    try:
+        await leader.heartbeat()
+    except Exception as e:
+        leader.last_error = str(e)
+        logger.error(f"Ошибка продления аренды лидера: {e}")
+    leader_task = asyncio.create_task(leader_election_worker())
+
+
+async def stop_leader_election():
+    global leader_task
+
+    if leader_task:
+        leader_task.cancel()
+        try:
+            await leader_task
+        except asyncio.CancelledError:
+            pass
+        leader_task = None
+    try:
+        await leader.release()
+    except Exception as e:
+        logger.error(f"Не удалось освободить аренду лидера: {e}")
+
+
+def get_leader() -> LeaderElector:
+    return leader
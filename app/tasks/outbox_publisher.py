@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete
+from sqlalchemy.future import select
+
+from app.db.database import AsyncSessionLocal
+from app.models.models_db import OutboxEvent, OutboxOffset
+from app.services.nats_service import get_nats_service
+from app.services.outbox import outbox_signal
+from app.tasks.leader import get_leader
+from app.app_config import settings
+
+logger = logging.getLogger(__name__)
+
+CONSUMER = "nats"
+NATS_UNAVAILABLE = "NATS не подключен"
+
+
+class OutboxStatus:
+    def __init__(self):
+        self.delivered = 0
+        self.last_event_id = 0
+        self.failures = 0
+        self.expired = 0
+        self.last_error: Optional[str] = None
+
+
+outbox_status = OutboxStatus()
+outbox_task: Optional[asyncio.Task] = None
+
+
+async def _load_offset(session) -> OutboxOffset:
+    offset = await session.get(OutboxOffset, CONSUMER)
+    if offset is None:
+        offset = OutboxOffset(consumer=CONSUMER, last_event_id=0)
+        session.add(offset)
+        await session.flush()
+    return offset
+
+
+async def publish_pending() -> int:
+    """Отправляет одну пачку недоставленных событий, возвращает их количество"""
+    async with AsyncSessionLocal() as session:
+        offset = await _load_offset(session)
+        result = await session.execute(
+            select(OutboxEvent.id, OutboxEvent.subject, OutboxEvent.payload)
+            .where(OutboxEvent.id > offset.last_event_id)
+            .order_by(OutboxEvent.id)
+            .limit(settings.OUTBOX_BATCH_SIZE)
+        )
+        events = result.all()
+        await session.commit()
+
+    if not events:
+        return 0
+
+    # Публикуем вне транзакции, чтобы не держать блокировку БД на время сети
+    nats = get_nats_service()
+    await nats.publish_many(
+        [(event.subject, event.payload.encode()) for event in events]
+    )
+
+    # Сдвигаем offset только после flush в NATS: at-least-once
+    async with AsyncSessionLocal() as session:
+        offset = await _load_offset(session)
+        offset.last_event_id = max(offset.last_event_id, events[-1].id)
+        await session.commit()
+
+    outbox_status.delivered += len(events)
+    outbox_status.last_event_id = events[-1].id
+    logger.debug(f"Outbox: доставлено {len(events)} событий до #{events[-1].id}")
+    return len(events)
+
+
+def _nats_connected() -> bool:
+    try:
+        nats = get_nats_service()
+    except RuntimeError:
+        return False
+    return bool(nats.nc and nats.nc.is_connected)
+
+
+async def prune_expired():
+    """Удаляет события старше OUTBOX_RETENTION, доставленные или нет.
+
+    Доставка at-least-once гарантируется только в пределах этого окна: без NATS
+    outbox иначе рос бы на пачку событий за каждое обновление курсов.
+    """
+    border = datetime.utcnow() - timedelta(seconds=settings.OUTBOX_RETENTION)
+    async with AsyncSessionLocal() as session:
+        offset = await _load_offset(session)
+        dropped = await session.execute(
+            delete(OutboxEvent).where(
+                (OutboxEvent.id > offset.last_event_id) &
+                (OutboxEvent.created_at < border)
+            )
+        )
+        await session.execute(delete(OutboxEvent).where(OutboxEvent.created_at < border))
+        await session.commit()
+
+    if dropped.rowcount:
+        outbox_status.expired += dropped.rowcount
+        logger.warning(f"Outbox: {dropped.rowcount} недоставленных событий старше {settings.OUTBOX_RETENTION}с удалены")
+
+
+async def outbox_publisher_worker():
+    logger.info("Публикатор outbox запускается")
+    backoff = 0.0
+    last_prune: Optional[datetime] = None
+
+    while True:
+        try:
+            if backoff:
+                await asyncio.sleep(backoff)
+
+            # Публикует только лидер, иначе каждый воркер отправит те же события
+            if not get_leader().is_leader:
+                await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL)
+                continue
+
+            if last_prune is None or datetime.utcnow() - last_prune > timedelta(seconds=settings.OUTBOX_RETENTION):
+                await prune_expired()
+                last_prune = datetime.utcnow()
+
+            if _nats_connected():
+                while await publish_pending() >= settings.OUTBOX_BATCH_SIZE:
+                    pass
+                outbox_status.last_error = None
+            elif outbox_status.last_error != NATS_UNAVAILABLE:
+                # Без NATS события только копятся до OUTBOX_RETENTION, повторять ошибку каждый цикл незачем
+                outbox_status.last_error = NATS_UNAVAILABLE
+                logger.warning(f"Outbox: {NATS_UNAVAILABLE}, события хранятся {settings.OUTBOX_RETENTION}с")
+
+            backoff = 0.0
+
+            try:
+                await asyncio.wait_for(
+                    outbox_signal.wait(),
+                    timeout=settings.OUTBOX_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+            outbox_signal.clear()
+
+        except asyncio.CancelledError:
+            logger.info("Отмена публикатора outbox")
+            break
+        except Exception as e:
+            outbox_status.failures += 1
+            outbox_status.last_error = str(e)
+            backoff = min(settings.OUTBOX_MAX_BACKOFF, max(0.5, backoff * 2))
+            logger.warning(f"Outbox: ошибка публикации ({e}), повтор через {backoff}с")
+
+
+async def start_outbox_publisher():
+    global outbox_task
+
+    if outbox_task and not outbox_task.done():
+        logger.warning("Публикатор outbox уже запущен")
+        return
+
+    outbox_task = asyncio.create_task(outbox_publisher_worker())
+
+
+async def stop_outbox_publisher():
+    global outbox_task
+
+    if outbox_task:
+        outbox_task.cancel()
+        try:
+            await outbox_task
+        except asyncio.CancelledError:
+            pass
+        logger.info("Публикатор outbox остановлен")
+
+
+def get_outbox_status() -> dict:
+    return {
+        "delivered": outbox_status.delivered,
+        "last_event_id": outbox_status.last_event_id,
+        "failures": outbox_status.failures,
+        "expired": outbox_status.expired,
+        "last_error": outbox_status.last_error
+    }
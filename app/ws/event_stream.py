@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import uuid
+from collections import deque
+from typing import Iterable, List, Optional, Sequence, Set
+
+from app.services.events import Event
+
+WILDCARD = "*"
+
+
+def matches_topics(topics: Iterable[str], pairs: Sequence[str]) -> bool:
+    """Событие без пар получают все, иначе - подписчики хотя бы одной его пары"""
+    if not pairs or WILDCARD in topics:
+        return True
+    for pair in pairs:
+        base, target = pair.split("/")
+        if pair in topics or f"{base}/*" in topics or f"*/{target}" in topics:
+            return True
+    return False
+
+
+class StreamSubscription:
+    """Подписчик потока вне WebSocket (SSE, long-poll): копит свои события до чтения.
+
+    Переполнение не блокирует рассылку: подписка помечается overflow, и клиент
+    переподключается с последним id, догоняясь из буфера или снимком.
+    """
+
+    def __init__(self, topics: Set[str], limit: int):
+        self.topics = topics
+        self.limit = limit
+        self.overflow = False
+        self._pending: List[Event] = []
+        self._wakeup = asyncio.Event()
+
+    def push(self, events: List[Event]):
+        matched = [event for event in events if matches_topics(self.topics, event.pairs)]
+        if not matched or self.overflow:
+            return
+        if len(self._pending) + len(matched) > self.limit:
+            self.overflow = True
+            self._pending.clear()
+        else:
+            self._pending.extend(matched)
+        self._wakeup.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """True, если есть что читать (или случилось переполнение)"""
+        if not self._pending and not self.overflow:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        return bool(self._pending) or self.overflow
+
+    def drain(self) -> List[Event]:
+        events, self._pending = self._pending, []
+        return events
+
+
+class EventStream:
+    """Нумерация рассылки WebSocket и кольцевой буфер последних событий.
+
+    Каждое разосланное событие получает seq, монотонный в пределах потока
+    (stream_id - один на процесс). Переподключившийся клиент присылает stream
+    и последний увиденный seq и получает только пропущенное, если оно ещё
+    в буфере; иначе (другой процесс, рестарт, вылет из окна) - снимок.
+    """
+
+    def __init__(self, size: int):
+        self.stream_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._buffer: deque = deque(maxlen=size)
+        self._subscriptions: Set[StreamSubscription] = set()
+
+    def sequence(self, events: List[Event]) -> List[Event]:
+        sequenced = []
+        for event in events:
+            self.seq += 1
+            event = event.with_seq(self.seq)
+            self._buffer.append(event)
+            sequenced.append(event)
+        for subscription in self._subscriptions:
+            subscription.push(sequenced)
+        return sequenced
+
+    def subscribe(self, topics: Set[str], limit: int) -> StreamSubscription:
+        subscription = StreamSubscription(topics, limit)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: StreamSubscription):
+        self._subscriptions.discard(subscription)
+
+    def event_id(self, seq: Optional[int] = None) -> str:
+        """Id для SSE и курсор long-poll в виде stream:seq"""
+        return f"{self.stream_id}:{self.seq if seq is None else seq}"
+
+    def since(self, stream_id: Optional[str], seq: int) -> Optional[List[Event]]:
+        """События после seq или None, если догнать из буфера нельзя"""
+        if stream_id != self.stream_id or seq < 0 or seq > self.seq:
+            return None
+        oldest = self.seq - len(self._buffer) + 1
+        if seq + 1 < oldest:
+            return None
+        return list(itertools.islice(self._buffer, seq + 1 - oldest, None))
+
+    def get_status(self) -> dict:
+        return {
+            "stream": self.stream_id,
+            "seq": self.seq,
+            "buffered": len(self._buffer),
+            "capacity": self._buffer.maxlen,
+            "subscribers": len(self._subscriptions)
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import List, Optional, Set
+
+from app.app_config import settings
+from app.services.currency_service import CurrencyService
+from app.services.events import Event, event_bus
+from app.services.nats_service import get_nats_service
+from app.ws.ws_manager import manager
+
+logger = logging.getLogger(__name__)
+
+
+class WsFanout:
+    """Рассылка событий по WebSocket-клиентам всех воркеров через внутренний subject NATS.
+
+    Свои события воркер отдаёт локальным клиентам сразу и параллельно публикует пачку
+    в NATS; остальные воркеры применяют её к своему снимку курсов и раскладывают по
+    своим клиентам. Эхо собственных пачек и повторы отбрасываются по event_id.
+    Без NATS работает только локальная рассылка, а снимки других воркеров догоняют
+    запись при сверке с БД (SNAPSHOT_CHECK_INTERVAL).
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.active = False
+        self.published = 0
+        self.received = 0
+        self.duplicates = 0
+        self.failures = 0
+        self._seen: Set[str] = set()
+        self._seen_order: deque = deque()
+        self._pending: Set[asyncio.Task] = set()
+
+    async def start(self):
+        try:
+            nats = get_nats_service()
+        except RuntimeError:
+            nats = None
+        if not nats or not nats.nc or not nats.nc.is_connected:
+            logger.warning("NATS недоступен, WebSocket-рассылка только внутри процесса")
+            return
+        self.active = await nats.subscribe(settings.WS_FANOUT_SUBJECT, self._on_message, raw=True)
+
+    async def stop(self):
+        self.active = False
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def publish_events(self, events: List[Event], data_version: Optional[int] = None):
+        """Обработчик event_bus"""
+        for event in events:
+            self._remember(event.id)
+        manager.fan_out(events)
+
+        if self.active:
+            task = asyncio.create_task(self._publish(events, data_version))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _publish(self, events: List[Event], data_version: Optional[int]):
+        # Тело - готовые payload'ы построчно, маршрутизация в заголовках: без перекодирования
+        headers = {
+            "Worker-Id": self.worker_id,
+            "Event-Ids": ",".join(event.id for event in events),
+            # Пары события через ";", события через ","
+            "Pairs": ",".join(";".join(event.pairs) for event in events)
+        }
+        if data_version is not None:
+            headers["Data-Version"] = str(data_version)
+        try:
+            await get_nats_service().publish_raw(
+                settings.WS_FANOUT_SUBJECT,
+                b"\n".join(event.payload for event in events),
+                headers=headers
+            )
+            self.published += len(events)
+        except Exception as e:
+            # Локальные клиенты уже получили события, теряются только чужие воркеры
+            self.failures += 1
+            logger.warning(f"Не удалось разослать события другим воркерам: {e}")
+
+    async def _on_message(self, msg):
+        headers = msg.headers or {}
+        if headers.get("Worker-Id") == self.worker_id:
+            return
+
+        event_ids = headers.get("Event-Ids", "").split(",")
+        pairs = headers.get("Pairs", "").split(",")
+        payloads = msg.data.split(b"\n")
+        if not (len(event_ids) == len(pairs) == len(payloads)):
+            logger.error("Повреждённая пачка событий рассылки, пропускаем")
+            return
+
+        try:
+            data_version = int(headers["Data-Version"]) if headers.get("Data-Version") else None
+            CurrencyService.apply_remote_events(payloads, data_version)
+        except Exception as e:
+            logger.error(f"Не удалось применить чужие события к снимку: {e}")
+            CurrencyService.snapshot.invalidate()
+
+        fresh = []
+        for event_id, event_pairs, payload in zip(event_ids, pairs, payloads):
+            if event_id in self._seen:
+                self.duplicates += 1
+                continue
+            self._remember(event_id)
+            fresh.append(Event(
+                event_id, "", settings.WS_FANOUT_SUBJECT,
+                tuple(event_pairs.split(";")) if event_pairs else (), payload
+            ))
+
+        self.received += len(fresh)
+        manager.fan_out(fresh)
+
+    def _remember(self, event_id: str):
+        self._seen.add(event_id)
+        self._seen_order.append(event_id)
+        if len(self._seen_order) > settings.WS_FANOUT_DEDUPE_SIZE:
+            self._seen.discard(self._seen_order.popleft())
+
+    def get_status(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "nats": self.active,
+            "published": self.published,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "failures": self.failures
+        }
+
+
+ws_fanout = WsFanout()
+event_bus.subscribe(ws_fanout.publish_events)
+
+
+async def start_ws_fanout():
+    await ws_fanout.start()
+
+
+async def stop_ws_fanout():
+    await ws_fanout.stop()
@@ -1,50 +1,323 @@
 from fastapi import WebSocket
-import json
+import asyncio
 import logging
-from typing import Set, Dict
+import re
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
 from datetime import datetime
 
+from app.app_config import settings
+from app.services.currency_service import CurrencyService
+from app.services.events import Event
+from app.services.metrics import WS_FANOUT_DURATION, WS_MESSAGES, registry
+from app.ws.event_stream import WILDCARD, EventStream, matches_topics
+
 logger = logging.getLogger(__name__)
 
+_TOPIC_RE = re.compile(r"^([A-Z]{3}|\*)/([A-Z]{3}|\*)$")
+
+# Кодировки кадров: json - текстовые кадры, msgpack - бинарные
+ENCODINGS = ("json", "msgpack")
+SUBPROTOCOLS = {"currencies.json": "json", "currencies.msgpack": "msgpack"}
+
+
+def normalize_topic(topic: str) -> Optional[str]:
+    """USD/EUR, USD/*, */EUR или * -> ключ индекса, иначе None"""
+    topic = topic.strip().upper()
+    if topic in (WILDCARD, "*/*"):
+        return WILDCARD
+    if _TOPIC_RE.match(topic):
+        return topic
+    return None
+
+
+def pair_topic(base: str, target: str) -> str:
+    return f"{base.upper()}/{target.upper()}"
 
-class ConnectionManager:    
+
+def negotiate_encoding(subprotocols: Sequence[str], requested: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Кодировка и подпротокол для ответа: Sec-WebSocket-Protocol важнее ?encoding="""
+    for subprotocol in subprotocols:
+        encoding = SUBPROTOCOLS.get(subprotocol)
+        if encoding:
+            return encoding, subprotocol
+    if requested in ENCODINGS:
+        return requested, None
+    return "json", None
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, queue_size: int, encoding: str = "json"):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = datetime.utcnow()
+        self.sender: Optional[asyncio.Task] = None
+        self.topics: Set[str] = set()
+        self.implicit_wildcard = False
+
+
+class ConnectionManager:
     def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-        self.client_data: Dict[WebSocket, dict] = {}
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.add(websocket)
-        self.client_data[websocket] = {"connected_at": datetime.utcnow()}
-        logger.info(f"Клиент подключен. Всего: {len(self.active_connections)}")
-    
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscriptions: Dict[str, Set[ClientConnection]] = {}
+        self.dropped_clients = 0
+        self.stream = EventStream(settings.WS_REPLAY_BUFFER)
+        self._closing: Set[asyncio.Task] = set()
+        self._snapshot_frames: Dict[FrozenSet[str], Event] = {}
+        self._snapshot_version: Optional[int] = None
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        topics: Optional[Iterable[str]] = None,
+        encoding: str = "json",
+        subprotocol: Optional[str] = None,
+        resume: Optional[Tuple[Optional[str], int]] = None
+    ):
+        """resume=(stream, последний seq): догнать пропущенное или прислать снимок"""
+        await websocket.accept(subprotocol=subprotocol)
+        # Дальше без await: живое событие не вклинится между приветствием, догонкой и подпиской
+        client = ClientConnection(websocket, settings.WS_QUEUE_SIZE, encoding)
+        client.sender = asyncio.create_task(self._sender(client))
+        self.active_connections[websocket] = client
+
+        if topics:
+            self._add_topics(client, topics)
+        else:
+            # Старые клиенты без подписки получают всё, пока не подпишутся явно
+            self._add_topics(client, [WILDCARD])
+            client.implicit_wildcard = True
+
+        self._enqueue(client, [Event.from_message({
+            "event_type": "connected",
+            "data": {
+                "message": "Connected to currency updates",
+                "timestamp": datetime.utcnow().isoformat(),
+                "encoding": encoding,
+                "stream": self.stream.stream_id,
+                "seq": self.stream.seq
+            }
+        })])
+        if resume is not None:
+            self._resume(client, *resume)
+        logger.info(f"Клиент подключен ({encoding}). Всего: {len(self.active_connections)}")
+
     async def disconnect(self, websocket: WebSocket):
-        self.active_connections.discard(websocket)
-        self.client_data.pop(websocket, None)
-        logger.info(f"Клиент отключился. Всего: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: dict):
-        disconnected = set()
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Ошибка отправки сообщения: {e}")
-                disconnected.add(connection)
-        
-        for connection in disconnected:
-            await self.disconnect(connection)
-    
+        client = self.active_connections.get(websocket)
+        if client:
+            self._drop(client)
+            logger.info(f"Клиент отключился. Всего: {len(self.active_connections)}")
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        client = self.active_connections.get(websocket)
+        if not client:
+            return []
+        if client.implicit_wildcard:
+            client.implicit_wildcard = False
+            self._remove_topics(client, [WILDCARD])
+        self._add_topics(client, topics)
+        return sorted(client.topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        client = self.active_connections.get(websocket)
+        if not client:
+            return []
+        client.implicit_wildcard = False
+        self._remove_topics(client, topics)
+        return sorted(client.topics)
+
+    def fan_out(self, events: List[Event]):
+        """Пачка событий: у каждого клиента она занимает одно место в очереди.
+
+        Событие получают подписчики хотя бы одной из его пар, без пар - все клиенты.
+        Кадр в нужной клиенту кодировке берётся из события при отправке.
+        """
+        started = time.perf_counter()
+        events = self.stream.sequence(events)
+        batches: Dict[ClientConnection, List[Event]] = {}
+
+        for event in events:
+            pairs = event.pairs
+            if not pairs:
+                recipients = self.active_connections.values()
+            elif len(pairs) == 1:
+                recipients = self._subscribers(pairs[0])
+            else:
+                recipients = set()
+                for pair in pairs:
+                    recipients.update(self._subscribers(pair))
+            for client in recipients:
+                batches.setdefault(client, []).append(event)
+
+        enqueued = 0
+        for client, batch in batches.items():
+            self._enqueue(client, batch)
+            enqueued += len(batch)
+
+        WS_MESSAGES.inc(enqueued)
+        WS_FANOUT_DURATION.observe(time.perf_counter() - started)
+
     async def send_personal(self, websocket: WebSocket, message: dict):
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            logger.error(f"Ошибка отправки ЛС: {e}")
-            await self.disconnect(websocket)
-    
+        client = self.active_connections.get(websocket)
+        if client:
+            self._enqueue(client, [Event.from_message(message)])
+
+    async def close_all(self):
+        clients = list(self.active_connections.values())
+        for client in clients:
+            self._drop(client, "server shutdown")
+        pending = [client.sender for client in clients if client.sender]
+        pending.extend(self._closing)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
     def get_connection_count(self) -> int:
         return len(self.active_connections)
 
+    def queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        """Пачки, ждущие отправки: суммарно и у самого отстающего клиента"""
+        depths = [client.queue.qsize() for client in self.active_connections.values()]
+        return {("sum",): sum(depths), ("max",): max(depths, default=0)}
+
+    def _resume(self, client: ClientConnection, stream_id: Optional[str], seq: int):
+        missed = self.stream.since(stream_id, seq)
+        if missed is None:
+            self._enqueue(client, [self.snapshot_frame(client.topics)])
+            return
+
+        batch = [event for event in missed if matches_topics(client.topics, event.pairs)]
+        batch.append(Event.from_message({
+            "event_type": "resumed",
+            "data": {
+                "stream": self.stream.stream_id,
+                "from_seq": seq,
+                "to_seq": self.stream.seq,
+                "replayed": len(batch)
+            }
+        }))
+        self._enqueue(client, batch)
+
+    def snapshot_frame(self, topics: Set[str]) -> Event:
+        """Снимок пар под подписки клиента; кадр кэшируется до следующей записи в снимок"""
+        snapshot = CurrencyService.snapshot
+        if not snapshot.loaded:
+            return Event.from_message({
+                "event_type": "resync_required",
+                "data": {"stream": self.stream.stream_id, "seq": self.stream.seq}
+            })
+
+        if self._snapshot_version != snapshot.version:
+            self._snapshot_frames.clear()
+            self._snapshot_version = snapshot.version
+
+        key = frozenset(topics)
+        frame = self._snapshot_frames.get(key)
+        if frame is None:
+            frame = Event.from_message({
+                "event_type": "snapshot",
+                "data": {
+                    "stream": self.stream.stream_id,
+                    "seq": self.stream.seq,
+                    "currencies": [
+                        item.model_dump(mode="json")
+                        for item in snapshot.active()
+                        if matches_topics(topics, (pair_topic(item.base, item.target),))
+                    ]
+                }
+            })
+            self._snapshot_frames[key] = frame
+        return frame
+
+    def _subscribers(self, pair: str) -> Set[ClientConnection]:
+        base, target = pair.split("/")
+        recipients: Set[ClientConnection] = set()
+        for topic in (pair, f"{base}/*", f"*/{target}", WILDCARD):
+            subscribers = self.subscriptions.get(topic)
+            if subscribers:
+                recipients.update(subscribers)
+        return recipients
+
+    def _add_topics(self, client: ClientConnection, topics: Iterable[str]):
+        for topic in topics:
+            client.topics.add(topic)
+            self.subscriptions.setdefault(topic, set()).add(client)
+
+    def _remove_topics(self, client: ClientConnection, topics: Iterable[str]):
+        for topic in list(topics):
+            client.topics.discard(topic)
+            subscribers = self.subscriptions.get(topic)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self.subscriptions[topic]
+
+    def _enqueue(self, client: ClientConnection, batch: List[Event]):
+        try:
+            client.queue.put_nowait(batch)
+        except asyncio.QueueFull:
+            logger.warning("Клиент не успевает читать, отключаем")
+            self._evict(client, "slow consumer")
+
+    def _evict(self, client: ClientConnection, reason: str):
+        if self.active_connections.get(client.websocket) is client:
+            self.dropped_clients += 1
+        self._drop(client, reason)
+
+    def _drop(self, client: ClientConnection, reason: Optional[str] = None):
+        if self.active_connections.get(client.websocket) is not client:
+            return
+        del self.active_connections[client.websocket]
+        self._remove_topics(client, client.topics)
+
+        if client.sender and client.sender is not asyncio.current_task():
+            client.sender.cancel()
+        if reason:
+            closing = asyncio.create_task(self._close(client, reason))
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+
+    async def _close(self, client: ClientConnection, reason: str):
+        try:
+            # 1013 - Try Again Later
+            await asyncio.wait_for(
+                client.websocket.close(code=1013, reason=reason),
+                timeout=1
+            )
+        except Exception:
+            pass
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                batch = await client.queue.get()
+                for event in batch:
+                    if client.encoding == "msgpack":
+                        send = client.websocket.send_bytes(event.binary)
+                    else:
+                        send = client.websocket.send_text(event.text)
+                    await asyncio.wait_for(send, timeout=settings.WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning(f"Таймаут отправки ({settings.WS_SEND_TIMEOUT}с), отключаем клиента")
+            self._evict(client, "send timeout")
+        except Exception as e:
+            logger.error(f"Ошибка отправки сообщения: {e}")
+            self._drop(client)
+
 
 manager = ConnectionManager()
+
+registry.gauge(
+    "ws_connections", "Подключённые WebSocket-клиенты",
+    callback=lambda: {(): manager.get_connection_count()}
+)
+registry.gauge(
+    "ws_queue_depth", "Очереди отправки WebSocket-клиентов", ("stat",),
+    callback=manager.queue_depths
+)
+registry.counter(
+    "ws_dropped_clients", "Клиенты, отключённые за медленное чтение",
+    callback=lambda: {(): manager.dropped_clients}
+)
@@ -0,0 +1,624 @@
+"""Бенчмарк приложения целиком: REST, рассылка WebSocket и циклы обновления курсов.
+
+Поднимает app.main:app под uvicorn на временной SQLite с провайдером stub,
+при --nats - с локальным nats-server. Сценарии:
+
+    rest         - конкурентные чтения и PATCH на /api/currencies
+    ws           - тысячи клиентов /ws/currencies, задержка от PATCH до получения события
+    refresh      - повторные update_currencies_in_db на вселенных разного размера (в процессе)
+    consistency  - два процесса на одной БД: PATCH на первом, через сколько второй отдаёт
+                   новый курс (REST, ETag, конвертация), и обновление курсов лидером;
+                   код выхода 1, если не дождались
+
+Результат - JSON (throughput, p50/p99, память); --compare печатает разницу с прошлым прогоном:
+    python -m benchmarks.bench_app --output before.json
+    python -m benchmarks.bench_app --scenario ws --ws-clients 5000 --nats --workers 2
+    python -m benchmarks.bench_app --output after.json --compare before.json
+    python -m benchmarks.bench_app --scenario consistency --nats
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _latency_stats(latencies, duration=None) -> dict:
+    stats = {
+        "count": len(latencies),
+        "p50_ms": round((_percentile(latencies, 0.5) or 0) * 1000, 3),
+        "p99_ms": round((_percentile(latencies, 0.99) or 0) * 1000, 3),
+        "max_ms": round(max(latencies, default=0) * 1000, 3),
+    }
+    if duration:
+        stats["per_sec"] = round(len(latencies) / duration, 1)
+    return stats
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Порт {port} не открылся за {timeout}с")
+
+
+def _universe(size: int):
+    """size пар из трёхбуквенных кодов; базы добавляются по мере роста"""
+    codes = ["".join(code) for code in itertools.product(string.ascii_uppercase, repeat=3)]
+    targets = codes[:max(2, min(len(codes), int(size ** 0.5) + 1))]
+    pairs = []
+    for base in codes:
+        for target in targets:
+            if target != base:
+                pairs.append((base, target))
+                if len(pairs) == size:
+                    return pairs
+    return pairs
+
+
+def _proc_memory_mb(pid: int) -> dict:
+    """RSS процесса и его детей (воркеры uvicorn) по /proc"""
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(entry))
+
+    rss = hwm = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, ()))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("VmHWM:"):
+                        hwm += int(line.split()[1])
+        except OSError:
+            continue
+    return {"rss_mb": round(rss / 1024, 1), "peak_rss_mb": round(hwm / 1024, 1)}
+
+
+class NatsServer:
+    def __init__(self, directory: str):
+        self.port = _free_port()
+        self.directory = directory
+        self.process = None
+
+    def __enter__(self):
+        binary = shutil.which("nats-server")
+        if binary is None:
+            raise RuntimeError("nats-server не найден в PATH")
+        self.process = subprocess.Popen(
+            [binary, "-a", "127.0.0.1", "-p", str(self.port)],
+            stdout=subprocess.DEVNULL,
+            stderr=open(os.path.join(self.directory, "nats.log"), "wb")
+        )
+        _wait_port(self.port, 10)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(10)
+
+    @property
+    def url(self) -> str:
+        return f"nats://127.0.0.1:{self.port}"
+
+
+class AppServer:
+    """uvicorn app.main:app во временном каталоге"""
+
+    def __init__(self, directory: str, nats_url: str, workers: int, extra_env: dict):
+        self.port = _free_port()
+        self.log_path = os.path.join(directory, "app.log")
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{directory}/bench.db",
+            # Пустой URL - быстрый отказ без повторных попыток подключения
+            "NATS_URL": nats_url,
+            "RATE_PROVIDERS": "stub",
+            # Фоновое обновление не должно вмешиваться в замеры REST и WS
+            "BACKGROUND_TASK_INTERVAL": "3600",
+            **extra_env,
+        }
+        self.workers = workers
+        self.process = None
+
+    def __enter__(self):
+        command = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--log-level", "warning", "--no-access-log",
+        ]
+        if self.workers > 1:
+            command += ["--workers", str(self.workers)]
+        self.process = subprocess.Popen(
+            command,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=open(self.log_path, "wb")
+        )
+        self._wait_ready(30)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def _wait_ready(self, timeout: float):
+        import httpx
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Сервер завершился, см. {self.log_path}")
+            try:
+                if httpx.get(f"{self.url}/ready", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise TimeoutError(f"Сервер не поднялся за {timeout}с, см. {self.log_path}")
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def memory(self) -> dict:
+        return _proc_memory_mb(self.process.pid)
+
+
+async def _seed(client, pairs) -> list:
+    ids = []
+    for start in range(0, len(pairs), 1000):
+        chunk = pairs[start:start + 1000]
+        response = await client.post("/api/currencies/bulk", json={"items": [
+            {"base": base, "target": target, "current_rate": random.uniform(0.5, 2.0)}
+            for base, target in chunk
+        ]})
+        response.raise_for_status()
+        ids.extend(item["id"] for item in response.json()["items"])
+    return ids
+
+
+async def _scenario_rest(server: AppServer, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.rest_concurrency, max_keepalive_connections=args.rest_concurrency)
+    async with httpx.AsyncClient(base_url=server.url, limits=limits, timeout=30) as client:
+        pairs = _universe(args.pairs)
+        ids = await _seed(client, pairs)
+        bases = sorted({base for base, _ in pairs})
+
+        operations = [
+            ("list_snapshot", lambda: client.get("/api/currencies")),
+            ("list_filtered", lambda: client.get("/api/currencies", params={"base": random.choice(bases), "limit": 100})),
+            ("get_item", lambda: client.get(f"/api/currencies/{random.choice(ids)}")),
+            ("patch_item", lambda: client.patch(
+                f"/api/currencies/{random.choice(ids)}",
+                json={"current_rate": random.uniform(0.5, 2.0)}
+            )),
+        ]
+        weights = [1, 2, 4, 4 * args.rest_write_ratio / max(1e-9, 1 - args.rest_write_ratio)]
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        stop = asyncio.Event()
+
+        async def worker():
+            while not stop.is_set():
+                name, request = random.choices(operations, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await request()
+                    if response.status_code >= 400:
+                        raise RuntimeError(response.status_code)
+                    latencies[name].append(time.perf_counter() - started)
+                except Exception:
+                    errors[name] += 1
+
+        memory_before = server.memory()
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(worker()) for _ in range(args.rest_concurrency)]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "pairs": len(pairs),
+        "concurrency": args.rest_concurrency,
+        "duration": round(elapsed, 2),
+        "requests_per_sec": round(total / elapsed, 1),
+        "errors": sum(errors.values()),
+        "operations": {
+            name: {**_latency_stats(latencies[name], elapsed), "errors": errors[name]}
+            for name, _ in operations
+        },
+        "memory_before": memory_before,
+        "memory_after": server.memory(),
+    }
+
+
+async def _scenario_ws(server: AppServer, args) -> dict:
+    import httpx
+    import websockets
+
+    ws_url = server.url.replace("http://", "ws://") + "/ws/currencies"
+    sent_at = {}
+    received = defaultdict(list)
+    connect_errors = 0
+    connected = 0
+
+    async def client_loop(ready: asyncio.Semaphore, done: asyncio.Event):
+        nonlocal connect_errors, connected
+        try:
+            async with ready:
+                websocket = await websockets.connect(ws_url, max_queue=None, open_timeout=30)
+                await websocket.recv()
+        except Exception:
+            connect_errors += 1
+            return
+        connected += 1
+        try:
+            while not done.is_set():
+                message = await websocket.recv()
+                now = time.perf_counter()
+                event = json.loads(message)
+                if event.get("event_type") == "updated":
+                    key = event["data"]["current_rate"]
+                    if key in sent_at:
+                        received[key].append(now)
+        except Exception:
+            pass
+        finally:
+            await websocket.close()
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=30) as client:
+        ids = await _seed(client, _universe(args.ws_pairs))
+
+        done = asyncio.Event()
+        connecting = asyncio.Semaphore(200)
+        tasks = [asyncio.create_task(client_loop(connecting, done)) for _ in range(args.ws_clients)]
+        while connected + connect_errors < args.ws_clients:
+            await asyncio.sleep(0.1)
+        memory_connected = server.memory()
+
+        interval = 1 / args.ws_rate
+        started = time.perf_counter()
+        for seq in range(args.ws_updates):
+            # Курс - уникальный ключ события: по нему клиент находит время отправки
+            rate = round(1 + (seq + 1) / 1e6, 6)
+            sent_at[rate] = time.perf_counter()
+            await client.patch(f"/api/currencies/{random.choice(ids)}", json={"current_rate": rate})
+            await asyncio.sleep(max(0.0, started + (seq + 1) * interval - time.perf_counter()))
+        publish_elapsed = time.perf_counter() - started
+
+        # Ждём, пока доставки перестанут прибывать
+        expected = args.ws_updates * connected
+        deadline = time.perf_counter() + args.ws_drain_timeout
+        while sum(map(len, received.values())) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        memory_after = server.memory()
+        done.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies, spreads = [], []
+    for key, times in received.items():
+        latencies.extend(moment - sent_at[key] for moment in times)
+        spreads.append(max(times) - min(times))
+    delivered = len(latencies)
+
+    return {
+        "clients": args.ws_clients,
+        "connected": connected,
+        "connect_errors": connect_errors,
+        "workers": args.workers,
+        "nats": args.nats,
+        "updates": args.ws_updates,
+        "update_rate": args.ws_rate,
+        "delivered": delivered,
+        "expected": expected,
+        "delivery_ratio": round(delivered / expected, 4) if expected else None,
+        "deliveries_per_sec": round(delivered / (publish_elapsed or 1), 1),
+        # От отправки PATCH до получения события клиентом
+        "latency": _latency_stats(latencies),
+        # Разброс между первым и последним получателем одного события
+        "fanout_spread": _latency_stats(spreads),
+        "memory_connected": memory_connected,
+        "memory_after": memory_after,
+    }
+
+
+async def _scenario_consistency(servers, args) -> dict:
+    import httpx
+
+    writer_server, reader_server = servers
+    async with httpx.AsyncClient(base_url=writer_server.url, timeout=30) as writer, \
+            httpx.AsyncClient(base_url=reader_server.url, timeout=30) as reader:
+        pairs = _universe(args.consistency_pairs)
+        ids = await _seed(writer, pairs)
+        rates = dict(zip(ids, pairs))
+        # Снимок второго процесса загружен до записей - иначе он просто прочитает свежую БД
+        (await reader.get("/api/currencies")).raise_for_status()
+
+        latencies, not_modified, failures = [], 0, 0
+        for seq in range(args.consistency_updates):
+            currency_id = random.choice(ids)
+            base, target = rates[currency_id]
+            tag = (await reader.get(f"/api/currencies/{currency_id}")).headers["etag"]
+            rate = round(1 + (seq + 1) / 1e6, 6)
+
+            started = time.perf_counter()
+            (await writer.patch(f"/api/currencies/{currency_id}", json={"current_rate": rate})).raise_for_status()
+            while True:
+                item = await reader.get(f"/api/currencies/{currency_id}", headers={"If-None-Match": tag})
+                converted = await reader.get("/api/convert", params={"from": base, "to": target, "amount": 1})
+                if item.status_code == 304:
+                    not_modified += 1
+                elif item.json()["current_rate"] == rate and converted.json()["rate"] == rate:
+                    latencies.append(time.perf_counter() - started)
+                    break
+                if time.perf_counter() - started > args.consistency_timeout:
+                    failures += 1
+                    break
+                await asyncio.sleep(0.005)
+
+        # Фоновое обновление пишет только лидер; запуск через другой процесс, ждём одинаковых списков
+        listed = (await reader.get("/api/currencies")).json()
+        (await reader.post("/api/tasks/run")).raise_for_status()
+        started = time.perf_counter()
+        refresh = None
+        while time.perf_counter() - started < args.consistency_timeout:
+            expected = (await writer.get("/api/currencies")).json()
+            actual = (await reader.get("/api/currencies")).json()
+            if expected != listed and expected == actual:
+                refresh = time.perf_counter() - started
+                break
+            await asyncio.sleep(0.05)
+
+        expected = (await writer.get("/api/currencies")).json()
+        actual = (await reader.get("/api/currencies")).json()
+
+    return {
+        "nats": args.nats,
+        "pairs": len(ids),
+        "updates": args.consistency_updates,
+        # От PATCH на первом процессе до нового курса во втором
+        "propagation": _latency_stats(latencies),
+        "stale_304": not_modified,
+        "failures": failures,
+        # От POST /api/tasks/run до одинаковых списков после обновления курсов лидером
+        "refresh_ms": round(refresh * 1000, 1) if refresh is not None else None,
+        "lists_match": expected == actual,
+    }
+
+
+async def _refresh_cycles(size: int, cycles: int) -> dict:
+    from app.db.database import close_db, init_db
+    from app.tasks.background_task import update_currencies_in_db
+
+    await init_db()
+    pairs = _universe(size)
+
+    def random_rates():
+        return {pair: random.uniform(0.5, 2.0) for pair in pairs}
+
+    started = time.perf_counter()
+    await update_currencies_in_db(random_rates())
+    first = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        await update_currencies_in_db(random_rates())
+        latencies.append(time.perf_counter() - started)
+    await close_db()
+
+    return {
+        "pairs": len(pairs),
+        "cycles": cycles,
+        "first_cycle_ms": round(first * 1000, 2),
+        **_latency_stats(latencies),
+        "pairs_per_sec": round(len(pairs) * len(latencies) / (sum(latencies) or 1), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _scenario_refresh(args) -> list:
+    # Настройки читаются при импорте app, поэтому каждая вселенная - отдельный процесс
+    results = []
+    for size in args.universe:
+        command = [
+            sys.executable, "-m", "benchmarks.bench_app",
+            "--refresh-child", str(size), "--refresh-cycles", str(args.refresh_cycles)
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def _run_refresh_child(size: int, cycles: int):
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{directory}/refresh.db"
+        import logging
+        logging.disable(logging.CRITICAL)
+        result = asyncio.run(_refresh_cycles(size, cycles))
+    print(json.dumps(result))
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(data, prefix=""):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(data, list):
+        for index, value in enumerate(data):
+            yield from _flatten(value, f"{prefix}[{index}]")
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, data
+
+
+SCENARIOS = ("rest", "ws", "refresh", "consistency")
+
+
+def _compare(previous: dict, current: dict):
+    old = dict(_flatten({key: previous.get(key) for key in SCENARIOS}))
+    for key, value in _flatten({key: current.get(key) for key in SCENARIOS}):
+        before = old.get(key)
+        if before in (None, 0) or before == value:
+            continue
+        print(f"{key:60} {before:>12} -> {value:<12} {(value - before) / before:+.1%}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=["all", "rest", "ws", "refresh", "consistency"], default="all")
+    parser.add_argument("--nats", action="store_true", help="поднять локальный nats-server")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--pairs", type=int, default=1000)
+    parser.add_argument("--rest-concurrency", type=int, default=32)
+    parser.add_argument("--rest-write-ratio", type=float, default=0.2)
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-pairs", type=int, default=100)
+    parser.add_argument("--ws-updates", type=int, default=200)
+    parser.add_argument("--ws-rate", type=float, default=50.0, help="PATCH в секунду")
+    parser.add_argument("--ws-drain-timeout", type=float, default=30.0)
+    parser.add_argument("--universe", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--refresh-cycles", type=int, default=20)
+    parser.add_argument("--consistency-pairs", type=int, default=100)
+    parser.add_argument("--consistency-updates", type=int, default=50)
+    parser.add_argument("--consistency-timeout", type=float, default=5.0)
+    parser.add_argument("--refresh-child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", help="JSON прошлого прогона")
+    args = parser.parse_args()
+
+    if args.refresh_child:
+        _run_refresh_child(args.refresh_child, args.refresh_cycles)
+        return
+    if args.workers > 1 and not args.nats:
+        parser.error("--workers > 1 без --nats: события WebSocket не дойдут до клиентов других воркеров")
+
+    result = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "refresh_child")},
+        }
+    }
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    for scenario in ("rest", "ws"):
+        if args.scenario not in ("all", scenario):
+            continue
+        # Свежая БД и процесс на каждый сценарий, чтобы они не влияли друг на друга
+        with tempfile.TemporaryDirectory() as directory:
+            nats = NatsServer(directory) if args.nats else None
+            if nats:
+                nats.__enter__()
+            try:
+                with AppServer(directory, nats.url if nats else "", args.workers, {}) as server:
+                    runner = _scenario_rest if scenario == "rest" else _scenario_ws
+                    result[scenario] = asyncio.run(runner(server, args))
+            finally:
+                if nats:
+                    nats.__exit__()
+
+    if args.scenario in ("all", "refresh"):
+        result["refresh"] = _scenario_refresh(args)
+
+    if args.scenario == "consistency":
+        with tempfile.TemporaryDirectory() as directory:
+            nats = NatsServer(directory) if args.nats else None
+            if nats:
+                nats.__enter__()
+            try:
+                # Два отдельных процесса на одной БД: у воркеров uvicorn общий порт, к ним не обратиться по отдельности
+                database = {
+                    "DATABASE_URL": f"sqlite+aiosqlite:///{directory}/bench.db",
+                    # Запрос запуска доходит до лидера с heartbeat аренды
+                    "LEADER_HEARTBEAT": "0.5",
+                }
+                servers = []
+                for name in ("writer", "reader"):
+                    os.makedirs(os.path.join(directory, name))
+                    servers.append(AppServer(os.path.join(directory, name), nats.url if nats else "", 1, database))
+                with servers[0], servers[1]:
+                    result["consistency"] = asyncio.run(_scenario_consistency(servers, args))
+            finally:
+                if nats:
+                    nats.__exit__()
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), result)
+
+    consistency = result.get("consistency")
+    if consistency and (consistency["failures"] or consistency["refresh_ms"] is None or not consistency["lists_match"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Микробенчмарк сериализации: до/после перехода на orjson и кодирование один раз.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_serialization [--clients 500] [--currencies 1000]
+"""
+import argparse
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models.models_db import Currency
+from app.models.schemas import CurrencyResponse
+from app.services.events import currency_events, dumps
+
+
+def _currencies(count: int) -> List[Currency]:
+    now = datetime.utcnow()
+    return [
+        Currency(
+            id=i,
+            base="USD",
+            target=f"{i % 1000:03d}",
+            current_rate=1 + i / 1000,
+            is_active=True,
+            last_updated=now
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def _measure(label: str, func, repeat: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<55} {elapsed * 1000:9.3f} мс")
+    return elapsed
+
+
+def bench_fan_out(currencies: List[Currency], clients: int, repeat: int):
+    print(f"\nРассылка {len(currencies)} событий на {clients} клиентов + NATS")
+    messages = [
+        {
+            "event_type": "updated",
+            "data": {
+                "id": c.id,
+                "base": c.base,
+                "target": c.target,
+                "current_rate": c.current_rate,
+                "last_updated": c.last_updated.isoformat()
+            },
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        for c in currencies
+    ]
+
+    def before():
+        # json.dumps на каждого получателя и отдельно для NATS
+        for message in messages:
+            json.dumps(message).encode()
+            for _ in range(clients):
+                json.dumps(message)
+
+    def after():
+        # Событие кодируется один раз, клиенты и NATS получают одни и те же байты
+        for event in currency_events("updated", currencies):
+            event.payload
+            for _ in range(clients):
+                event.text
+
+    slow = _measure("до: json.dumps на клиента", before, repeat)
+    fast = _measure("после: orjson, encode once", after, repeat)
+    print(f"{'ускорение':<55} {slow / fast:9.1f}x")
+
+
+def bench_rest_list(currencies: List[Currency], repeat: int):
+    print(f"\nGET /api/currencies на {len(currencies)} строк")
+    items = [CurrencyResponse.model_validate(c) for c in currencies]
+    adapter = TypeAdapter(List[CurrencyResponse])
+
+    def before():
+        # Путь response_model в FastAPI: валидация, jsonable_encoder, json.dumps
+        json.dumps(jsonable_encoder(adapter.validate_python(items))).encode()
+
+    def orjson_dicts():
+        dumps([item.model_dump() for item in items])
+
+    def after():
+        # Пересборка тела снимка; между записями тело отдаётся из кэша
+        adapter.dump_json(items)
+
+    slow = _measure("до: response_model + jsonable_encoder + json", before, repeat)
+    _measure("orjson.dumps(model_dump())", orjson_dicts, repeat)
+    fast = _measure("после: TypeAdapter.dump_json (тело снимка)", after, repeat)
+    print(f"{'ускорение':<55} {slow / fast:9.1f}x")
+
+
+def bench_ws_encodings(currencies: List[Currency], repeat: int):
+    """Размер кадров WebSocket по кодировкам, с permessage-deflate и без"""
+    print(f"\nКадры WebSocket: {len(currencies)} событий updated")
+    events = currency_events("updated", currencies)
+
+    def deflated(frames: List[bytes]) -> int:
+        # permessage-deflate с context takeover: общий словарь на всё соединение
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return sum(len(compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4 for frame in frames)
+
+    json_frames = [event.payload for event in events]
+    binary_frames = [event.binary for event in events]
+    plain = sum(map(len, json_frames))
+    for label, size in (
+        ("json", plain),
+        ("msgpack", sum(map(len, binary_frames))),
+        ("json + permessage-deflate", deflated(json_frames)),
+        ("msgpack + permessage-deflate", deflated(binary_frames)),
+    ):
+        print(f"{label:<55} {size / len(events):9.1f} Б/кадр {plain / size:6.1f}x")
+
+    _measure("msgpack: кодирование пачки (один раз на событие)", lambda: [
+        event.binary for event in currency_events("updated", currencies)
+    ], repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--currencies", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    currencies = _currencies(args.currencies)
+    bench_fan_out(currencies[:args.events], args.clients, args.repeat)
+    bench_rest_list(currencies, args.repeat)
+    bench_ws_encodings(currencies[:args.events], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
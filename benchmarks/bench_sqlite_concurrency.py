@@ -0,0 +1,156 @@
+"""Нагрузочный тест SQLite: конкурентные чтения во время обновлений курсов.
+
+Фоновый писатель в цикле делает bulk_upsert_rates по всей вселенной пар,
+несколько "API"-писателей обновляют отдельные пары через CurrencyService.update,
+читатели параллельно выполняют SQL-выборки из CurrencyService.get_all. Считаются
+ошибки (в т.ч. "database is locked"), пропускная способность и задержки чтения.
+
+Профиль задаётся до импорта app, поэтому каждый профиль - отдельный процесс:
+    python -m benchmarks.bench_sqlite_concurrency                 # default и sqlite_wal
+    python -m benchmarks.bench_sqlite_concurrency --profile sqlite_wal --readers 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _run(args) -> dict:
+    from app.db.database import AsyncSessionLocal, ReadSessionLocal, close_db, init_db
+    from app.models.schemas import CurrencyUpdate
+    from app.services.currency_service import CurrencyService
+
+    await init_db()
+
+    codes = [f"{a}{b}{c}" for a in "ABCDEFGH" for b in "ABCD" for c in "XYZ"]
+    pairs = [(base, target) for base in codes[:args.bases] for target in codes if target != base]
+
+    def random_rates():
+        return {pair: random.uniform(0.5, 2.0) for pair in pairs}
+
+    async with AsyncSessionLocal() as session:
+        await CurrencyService.bulk_upsert_rates(session, random_rates())
+
+    stop = asyncio.Event()
+    stats = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0, "locked": 0}
+    read_latencies = []
+    write_latencies = []
+
+    def record_error(kind, error):
+        stats[f"{kind}_errors"] += 1
+        if "locked" in str(error):
+            stats["locked"] += 1
+
+    async def writer():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as session:
+                    result = await CurrencyService.bulk_upsert_rates(session, random_rates())
+                if result is None:
+                    raise RuntimeError("bulk_upsert_rates вернул None")
+                stats["writes"] += 1
+                write_latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                record_error("write", e)
+            await asyncio.sleep(args.write_pause)
+
+    async def api_writer():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as session:
+                    currency = await CurrencyService.update(
+                        session,
+                        random.randint(1, len(pairs)),
+                        CurrencyUpdate(current_rate=random.uniform(0.5, 2.0))
+                    )
+                if currency is None:
+                    raise RuntimeError("update вернул None")
+                stats["writes"] += 1
+                write_latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                record_error("write", e)
+            await asyncio.sleep(args.write_pause)
+
+    async def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                async with ReadSessionLocal() as session:
+                    page = await CurrencyService.get_all(
+                        session,
+                        base=random.choice(codes[:args.bases]),
+                        limit=100
+                    )
+                if page is None:
+                    # get_all глотает SQLAlchemyError и пишет его в лог
+                    raise RuntimeError("get_all вернул None")
+                stats["reads"] += 1
+                read_latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                record_error("read", e)
+
+    tasks = [asyncio.create_task(writer())]
+    tasks += [asyncio.create_task(api_writer()) for _ in range(args.api_writers)]
+    tasks += [asyncio.create_task(reader()) for _ in range(args.readers)]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    await close_db()
+
+    return {
+        "profile": os.environ["DB_PROFILE"],
+        "pairs": len(pairs),
+        "readers": args.readers,
+        "api_writers": args.api_writers,
+        "duration": args.duration,
+        **stats,
+        "reads_per_sec": round(stats["reads"] / args.duration, 1),
+        "read_p50_ms": round((_percentile(read_latencies, 0.5) or 0) * 1000, 2),
+        "read_p99_ms": round((_percentile(read_latencies, 0.99) or 0) * 1000, 2),
+        "write_p50_ms": round((_percentile(write_latencies, 0.5) or 0) * 1000, 2),
+        "write_p99_ms": round((_percentile(write_latencies, 0.99) or 0) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", choices=["default", "sqlite_wal"])
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--api-writers", type=int, default=4)
+    parser.add_argument("--bases", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-pause", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.profile is None:
+        for profile in ("default", "sqlite_wal"):
+            command = [sys.executable, "-m", "benchmarks.bench_sqlite_concurrency", "--profile", profile]
+            command += sys.argv[1:]
+            subprocess.run(command, check=True)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DB_PROFILE"] = args.profile
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{directory}/stress.db"
+        import logging
+        logging.disable(logging.CRITICAL)
+        result = asyncio.run(_run(args))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()